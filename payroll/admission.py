@@ -0,0 +1,152 @@
+import io
+import math
+import re
+import threading
+import time
+import zipfile
+from collections import deque
+from contextlib import contextmanager
+
+
+DIMENSION_RE = re.compile(rb'<dimension ref="[A-Z]+\d+:([A-Z]+)(\d+)"')
+# Uncompressed sheet XML per cell, for sheets written without a <dimension>.
+XML_BYTES_PER_CELL = 50
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after):
+        super().__init__("server_busy")
+        self.retry_after = retry_after
+
+
+def column_number(letters):
+    number = 0
+    for ch in letters:
+        number = number * 26 + ord(ch) - 64
+    return number
+
+
+def worksheet_sizes(data):
+    # (cells, rows) per worksheet, read from the <dimension> element at the top
+    # of each sheet's XML without loading the workbook. Sheets written without
+    # one are sized from their XML (rows unknown: 0). Non-xlsx input yields
+    # nothing so the parser can report the real error.
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        return []
+    sizes = []
+    with archive:
+        for info in archive.infolist():
+            if not info.filename.startswith("xl/worksheets/") or not info.filename.endswith(".xml"):
+                continue
+            with archive.open(info) as fh:
+                match = DIMENSION_RE.search(fh.read(4096))
+            if match:
+                rows = int(match.group(2))
+                sizes.append((column_number(match.group(1).decode()) * rows, rows))
+            else:
+                sizes.append((info.file_size // XML_BYTES_PER_CELL, 0))
+    return sizes
+
+
+def workbook_cells(data):
+    # Cell count of the largest worksheet.
+    return max((cells for cells, _ in worksheet_sizes(data)), default=0)
+
+
+def workbook_rows(data):
+    return max((rows for _, rows in worksheet_sizes(data)), default=0)
+
+
+def estimate_parse_bytes(data, cell_bytes):
+    # Upload bytes plus what openpyxl holds per cell while parsing.
+    return len(data) + workbook_cells(data) * cell_bytes
+
+
+class AdmissionController:
+    # Bounds the memory spent on concurrent workbook parses. Each parse asks
+    # for its estimated cost in bytes; it runs once fewer than max_parses are
+    # in flight and the total stays under max_bytes, otherwise it waits in a
+    # FIFO queue for up to queue_timeout seconds. A full queue or an expired
+    # wait raises AdmissionRejected with a Retry-After hint derived from recent
+    # parse durations. Limits are per process (each gunicorn worker has its own).
+    def __init__(self, max_bytes=512 * 1024 * 1024, max_parses=2, max_queue=8, queue_timeout=30.0):
+        self.max_bytes = max_bytes
+        self.max_parses = max(1, max_parses)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._in_flight = 0
+        self._in_flight_bytes = 0
+        self._avg_seconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _fits(self, cost):
+        return self._in_flight < self.max_parses and self._in_flight_bytes + cost <= self.max_bytes
+
+    def _retry_after(self):
+        waves = (len(self._queue) + self._in_flight) / self.max_parses
+        return max(1, math.ceil(self._avg_seconds * max(waves, 1)))
+
+    @contextmanager
+    def admit(self, cost):
+        # An upload larger than the whole budget still runs, just on its own.
+        cost = min(cost, self.max_bytes)
+        with self._cond:
+            if self._queue or not self._fits(cost):
+                self._wait(cost)
+            self._in_flight += 1
+            self._in_flight_bytes += cost
+            self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._in_flight_bytes -= cost
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.monotonic() - started)
+                self._cond.notify_all()
+
+    def _wait(self, cost):
+        # Called with the condition held; returns once this ticket is at the
+        # head of the queue and fits.
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self._retry_after())
+        ticket = object()
+        self._queue.append(ticket)
+        self._queued_bytes += cost
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while self._queue[0] is not ticket or not self._fits(cost):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out += 1
+                    raise AdmissionRejected(self._retry_after())
+                self._cond.wait(remaining)
+        finally:
+            self._queue.remove(ticket)
+            self._queued_bytes -= cost
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "in_flight_bytes": self._in_flight_bytes,
+                "queue_depth": len(self._queue),
+                "queued_bytes": self._queued_bytes,
+                "max_parses": self.max_parses,
+                "max_bytes": self.max_bytes,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_parse_seconds": round(self._avg_seconds, 3),
+            }
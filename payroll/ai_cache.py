@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+
+def canonical_content(content):
+    # JSON payloads are re-serialized with sorted keys so dict ordering and
+    # whitespace do not produce different keys for the same prompt.
+    if not isinstance(content, str):
+        return json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        return " ".join(content.split())
+    return json.dumps(parsed, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def hash_key(value):
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def build_cache_key(model, messages, temperature, max_tokens):
+    # max_tokens is part of the key: a reply cut short by a small limit must
+    # not be served to a caller that allows a longer one.
+    system = [m.get("content") for m in messages if m.get("role") == "system"]
+    user = [canonical_content(m.get("content")) for m in messages if m.get("role") != "system"]
+    return hash_key(
+        {"model": model, "system": system, "user": user, "temperature": temperature, "max_tokens": max_tokens}
+    )
+
+
+class AICache:
+    def __init__(self, path=None, ttl=86400, max_items=256):
+        self.path = path
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self.lookups = {"memory": 0, "disk": 0, "miss": 0}
+        if self.path:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                # WAL lets several worker processes read while one writes.
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS ai_cache ("
+                    "key TEXT PRIMARY KEY, content TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _remember(self, key, content, expires_at):
+        self._memory[key] = (content, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        # Returns (content, tier) where tier is "memory", "disk" or None on a miss.
+        if not self.enabled:
+            return None, None
+        content, tier = self._lookup(key)
+        with self._lock:
+            self.lookups[tier or "miss"] += 1
+        return content, tier
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[1] > now:
+                    self._memory.move_to_end(key)
+                    return item[0], "memory"
+                del self._memory[key]
+
+        if not self.path:
+            return None, None
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT content, expires_at FROM ai_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] <= now:
+                    conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                    row = None
+        except sqlite3.Error:
+            return None, None
+        if not row:
+            return None, None
+        with self._lock:
+            self._remember(key, row[0], row[1])
+        return row[0], "disk"
+
+    def put(self, key, content):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, content, expires_at)
+        if not self.path:
+            return
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ai_cache (key, content, expires_at) VALUES (?, ?, ?)",
+                    (key, content, expires_at),
+                )
+                conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"items": len(self._memory), "max_items": self.max_items, "lookups": dict(self.lookups)}
@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import closing
+from datetime import date, datetime, time as dt_time, timedelta
+
+
+# Parsed rows carry dates (and raw cell values may be times), which JSON
+# has no type for: they are stored as single-key objects tagged with the
+# type and decoded back on read. datetime is checked before its parent date.
+ENCODERS = (
+    (datetime, "__datetime__", datetime.isoformat),
+    (date, "__date__", date.isoformat),
+    (dt_time, "__time__", dt_time.isoformat),
+    (timedelta, "__timedelta__", timedelta.total_seconds),
+)
+DECODERS = {
+    "__datetime__": datetime.fromisoformat,
+    "__date__": date.fromisoformat,
+    "__time__": dt_time.fromisoformat,
+    "__timedelta__": lambda seconds: timedelta(seconds=seconds),
+}
+
+
+def encode_value(value):
+    for kind, tag, encode in ENCODERS:
+        if isinstance(value, kind):
+            return {tag: encode(value)}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def decode_object(obj):
+    if len(obj) == 1:
+        (tag, value), = obj.items()
+        decode = DECODERS.get(tag)
+        if decode is not None:
+            return decode(value)
+    return obj
+
+
+def dumps(data):
+    return json.dumps(data, default=encode_value, separators=(",", ":"))
+
+
+def loads(text):
+    return json.loads(text, object_hook=decode_object)
+
+
+class AnalysisNotFound(LookupError):
+    pass
+
+
+class AnalysisStore:
+    # Keeps recent /api/analyze results (or parsed uploads) in memory so later
+    # calls can refer to them by id. Entries expire after `ttl` seconds; the
+    # least recently used ones are evicted once the total exceeds max_bytes or
+    # max_items. `label` names the id in not-found errors.
+    #
+    # With `path`, entries are also written as JSON to a SQLite table so every
+    # worker process sharing that file can serve them; memory stays a
+    # per-process tier. Entries that cannot be encoded stay memory-only.
+    def __init__(self, ttl=3600, max_bytes=64 * 1024 * 1024, max_items=64, label="analysis", path=None):
+        self.label = label
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.path = path
+        self._table = f"{label}_store"
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._bytes = 0
+        self.lookups = {"memory": 0, "shared": 0, "miss": 0}
+        if self.path:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self._table} ("
+                    "id TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, expires_at REAL NOT NULL)"
+                )
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _drop(self, analysis_id):
+        _, _, size = self._items.pop(analysis_id)
+        self._bytes -= size
+
+    def _evict(self):
+        now = time.time()
+        for analysis_id in [k for k, v in self._items.items() if v[1] <= now]:
+            self._drop(analysis_id)
+        while self._items and (len(self._items) > self.max_items or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._items)))
+
+    def _remember(self, analysis_id, data, expires_at, size):
+        with self._lock:
+            if analysis_id in self._items:
+                self._drop(analysis_id)
+            self._items[analysis_id] = (data, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    def _write(self, analysis_id, data, expires_at, size):
+        # The shared table gets the same bounds; the soonest-expiring rows go first.
+        try:
+            text = dumps(data)
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self._table} (id, data, size, expires_at) VALUES (?, ?, ?, ?)",
+                    (analysis_id, text, size, expires_at),
+                )
+                conn.execute(f"DELETE FROM {self._table} WHERE expires_at <= ?", (time.time(),))
+                rows = conn.execute(f"SELECT id, size FROM {self._table} ORDER BY expires_at DESC").fetchall()
+                total = 0
+                for count, (row_id, row_size) in enumerate(rows, start=1):
+                    total += row_size
+                    if count > self.max_items or total > self.max_bytes:
+                        conn.execute(f"DELETE FROM {self._table} WHERE id = ?", (row_id,))
+        except (sqlite3.Error, TypeError, ValueError):
+            pass
+
+    def _read(self, analysis_id):
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    f"SELECT data, size, expires_at FROM {self._table} WHERE id = ?", (analysis_id,)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not row or row[2] <= time.time():
+            return None
+        try:
+            data = loads(row[0])
+        except (TypeError, ValueError):  # e.g. a row written by an older format
+            return None
+        self._remember(analysis_id, data, row[2], row[1])
+        return data
+
+    def put(self, analysis_id, data, size):
+        # size is the (approximate) size of data in bytes, used for the memory bound.
+        if self.ttl <= 0 or size > self.max_bytes:
+            return False
+        expires_at = time.time() + self.ttl
+        self._remember(analysis_id, data, expires_at, size)
+        if self.path:
+            self._write(analysis_id, data, expires_at, size)
+        return True
+
+    def find(self, analysis_id):
+        # Like get(), but returns None instead of raising.
+        with self._lock:
+            item = self._items.get(analysis_id)
+            if item is not None and item[1] <= time.time():
+                self._drop(analysis_id)
+                item = None
+            if item is not None:
+                self._items.move_to_end(analysis_id)
+                self.lookups["memory"] += 1
+                return item[0]
+        data = self._read(analysis_id) if self.path else None
+        with self._lock:
+            self.lookups["miss" if data is None else "shared"] += 1
+        return data
+
+    def get(self, analysis_id):
+        data = self.find(analysis_id)
+        if data is None:
+            raise AnalysisNotFound(f"{self.label}_not_found")
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "lookups": dict(self.lookups),
+            }
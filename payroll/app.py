@@ -1,18 +1,49 @@
+import gzip
+import hashlib
+import heapq
+import hmac
 import io
 import json
 import math
 import os
 import re
 import html
+import time
+import uuid
+from collections import Counter
 from datetime import date, datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor
-
-import requests
-from flask import Flask, jsonify, render_template, request
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from flask import (
+    Flask,
+    Response,
+    g,
+    has_request_context,
+    jsonify,
+    render_template,
+    request,
+    send_file,
+    stream_with_context,
+)
 from flask_cors import CORS
 from openpyxl import load_workbook
 from dotenv import load_dotenv
 
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+from admission import AdmissionController, AdmissionRejected, estimate_parse_bytes, workbook_rows
+from ai_cache import AICache, hash_key
+from analysis_store import AnalysisNotFound, AnalysisStore
+from grok_client import CircuitBreaker, GrokClient, failure_reason
+from json_stream import StreamingListParser
+from jobs import FINAL_STATUSES, JobQueue, JobQueueFull
+from metrics import MetricsRegistry
+from profiling import ProfileStore, new_profile_id, valid_request_id
+from upload_progress import UploadProgress
+
 
 DATE_HEADER = "Date/Time Europe/Belgrade"
 EMP_HEADER = "Employees"
@@ -123,6 +154,7 @@ TOS_RISK_PATTERNS = {
 
 app = Flask(__name__)
 load_dotenv()
+app.logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
 
 def normalize_cors_origins(raw):
     if not raw:
@@ -150,6 +182,76 @@ GROK_API_KEY = os.getenv("GROK_API_KEY", "")
 GROK_BASE_URL = os.getenv("GROK_BASE_URL", "https://api.x.ai/v1")
 GROK_MODEL = os.getenv("GROK_MODEL", "grok-2-mini")
 GROK_THRESHOLD = float(os.getenv("GROK_THRESHOLD", "0.7"))
+# Local answer scores at or above threshold + high margin are graded correct
+# without calling Grok. Grading scores at or below threshold - low margin
+# incorrect locally is opt-in (unset = off): a correct paraphrase can share
+# no words with the ideal answer, so only Grok can judge it.
+EVAL_LOCAL_HIGH_MARGIN = float(os.getenv("EVAL_LOCAL_HIGH_MARGIN", "0.2"))
+EVAL_LOCAL_LOW_MARGIN = float(os.getenv("EVAL_LOCAL_LOW_MARGIN")) if os.getenv("EVAL_LOCAL_LOW_MARGIN") else None
+EVAL_BATCH_PROMPT_BUDGET = int(os.getenv("EVAL_BATCH_PROMPT_BUDGET", "3000"))
+EVAL_BATCH_MAX_ITEMS = int(os.getenv("EVAL_BATCH_MAX_ITEMS", "20"))
+GROK_POOL_SIZE = int(os.getenv("GROK_POOL_SIZE", "10"))
+GROK_MAX_RETRIES = int(os.getenv("GROK_MAX_RETRIES", "2"))
+GROK_BREAKER_WINDOW = int(os.getenv("GROK_BREAKER_WINDOW", "20"))
+GROK_BREAKER_ERROR_RATE = float(os.getenv("GROK_BREAKER_ERROR_RATE", "0.5"))
+# Successful calls slower than this also count as breaker failures; 0 (the
+# default) trips only on errors and timeouts, since normal calls take 5-25 s.
+GROK_BREAKER_SLOW_SECONDS = float(os.getenv("GROK_BREAKER_SLOW_SECONDS", "0"))
+GROK_BREAKER_COOLDOWN = float(os.getenv("GROK_BREAKER_COOLDOWN", "30"))
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", os.path.join(BASE_DIR, "ai_cache.sqlite3"))
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", "86400"))
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "256"))
+AI_WORKERS = int(os.getenv("AI_WORKERS", "8"))
+AI_BATCH_DEADLINE = float(os.getenv("AI_BATCH_DEADLINE", "30"))
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(BASE_DIR, "jobs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL = int(os.getenv("JOB_TTL", "86400"))
+AI_PROMPT_BUDGET = int(os.getenv("AI_PROMPT_BUDGET", "6000"))
+AI_PROMPT_SAMPLES = int(os.getenv("AI_PROMPT_SAMPLES", "8"))
+# USD per million tokens; only used for the cost estimate in /api/ai-stats.
+GROK_PROMPT_PRICE = float(os.getenv("GROK_PROMPT_PRICE", "0"))
+GROK_COMPLETION_PRICE = float(os.getenv("GROK_COMPLETION_PRICE", "0"))
+AI_METRICS_LOG = os.getenv("AI_METRICS_LOG", "")
+ANALYSIS_TTL = int(os.getenv("ANALYSIS_TTL", "3600"))
+ANALYSIS_MAX_BYTES = int(os.getenv("ANALYSIS_MAX_BYTES", str(64 * 1024 * 1024)))
+ANALYSIS_MAX_ITEMS = int(os.getenv("ANALYSIS_MAX_ITEMS", "64"))
+ANALYSIS_TOP_PEERS = 3
+DATASET_TTL = int(os.getenv("DATASET_TTL", "3600"))
+DATASET_MAX_BYTES = int(os.getenv("DATASET_MAX_BYTES", str(256 * 1024 * 1024)))
+DATASET_MAX_ITEMS = int(os.getenv("DATASET_MAX_ITEMS", "16"))
+DATASET_ROW_BYTES = 1024
+# Background upload jobs report parse progress every this many rows.
+PROGRESS_ROWS = 1000
+JOB_EVENTS_INTERVAL = 0.5
+# SQLite file shared by worker processes for analyses and parsed datasets;
+# empty keeps them in process memory only (fine for the single-process dev server).
+SHARED_STORE_PATH = os.getenv("SHARED_STORE_PATH", "")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# Memory budget for concurrent workbook parses (per worker process).
+ADMISSION_MAX_BYTES = int(os.getenv("ADMISSION_MAX_BYTES", str(512 * 1024 * 1024)))
+ADMISSION_MAX_PARSES = int(os.getenv("ADMISSION_MAX_PARSES", "2"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "8"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# Approximate openpyxl memory per cell: full load for sales, read_only for chat.
+SALES_CELL_BYTES = 400
+CHAT_CELL_BYTES = 100
+# Background analyze jobs (async=true) run on their own pool; queued and
+# running ones may hold at most this many uploads / estimated bytes.
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", str(ADMISSION_MAX_PARSES)))
+UPLOAD_JOB_QUEUE_SIZE = int(os.getenv("UPLOAD_JOB_QUEUE_SIZE", str(ADMISSION_QUEUE_SIZE)))
+UPLOAD_JOB_MAX_BYTES = int(os.getenv("UPLOAD_JOB_MAX_BYTES", str(ADMISSION_MAX_BYTES)))
+# Profiling is opt-in per request (X-Profile header or ?profile= matching
+# this token); empty disables it.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# Requests larger than this are refused with 413 before they are buffered; 0 = no limit.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", "0"))
+if MAX_UPLOAD_BYTES > 0:
+    app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 
 
 def build_grok_url():
@@ -161,6 +263,91 @@ def build_grok_url():
     return f"{base}/v1/chat/completions"
 
 
+GROK = GrokClient(
+    build_grok_url(),
+    GROK_API_KEY,
+    GROK_MODEL,
+    pool_size=GROK_POOL_SIZE,
+    max_retries=GROK_MAX_RETRIES,
+    cache=AICache(AI_CACHE_PATH, ttl=AI_CACHE_TTL, max_items=AI_CACHE_SIZE),
+    breaker=CircuitBreaker(
+        window=GROK_BREAKER_WINDOW,
+        error_rate=GROK_BREAKER_ERROR_RATE,
+        slow_seconds=GROK_BREAKER_SLOW_SECONDS or None,
+        cooldown=GROK_BREAKER_COOLDOWN,
+    ),
+    prompt_price=GROK_PROMPT_PRICE,
+    completion_price=GROK_COMPLETION_PRICE,
+    metrics_log=AI_METRICS_LOG or None,
+)
+
+# Recent /api/analyze results, referenced by analysis_id in follow-up calls.
+ANALYSES = AnalysisStore(
+    ttl=ANALYSIS_TTL,
+    max_bytes=ANALYSIS_MAX_BYTES,
+    max_items=ANALYSIS_MAX_ITEMS,
+    path=SHARED_STORE_PATH or None,
+)
+# Parsed upload rows, referenced by dataset_id in /api/requery.
+DATASETS = AnalysisStore(
+    ttl=DATASET_TTL,
+    max_bytes=DATASET_MAX_BYTES,
+    max_items=DATASET_MAX_ITEMS,
+    label="dataset",
+    path=SHARED_STORE_PATH or None,
+)
+
+# Caps concurrent workbook parses by estimated memory; see admission.py.
+ADMISSION = AdmissionController(
+    max_bytes=ADMISSION_MAX_BYTES,
+    max_parses=ADMISSION_MAX_PARSES,
+    max_queue=ADMISSION_QUEUE_SIZE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+)
+
+# Served in the Prometheus text format at /metrics (per worker process).
+METRICS = MetricsRegistry()
+METRICS.histogram("stage_duration_seconds", "Time spent in each analysis stage.")
+METRICS.histogram("http_request_duration_seconds", "Request handling time by route, method and status.")
+METRICS.counter("rows_total", "Workbook rows read, by sheet and whether they were parsed or skipped.")
+METRICS.counter("upload_bytes_total", "Uploaded workbook bytes by sheet.")
+
+PROFILES = ProfileStore(PROFILE_DIR, keep=PROFILE_KEEP)
+
+# Server-Timing phases reported on every response, and the stages feeding them.
+SERVER_TIMING_PHASES = ("parse", "aggregate", "compare", "ai", "serialize")
+STAGE_PHASES = {
+    "parse_sales": "parse",
+    "parse_chat": "parse",
+    "aggregate_sales": "aggregate",
+    "aggregate_chat": "aggregate",
+    "leaderboard": "aggregate",
+    "compare": "compare",
+    "ai": "ai",
+    "serialize": "serialize",
+}
+
+
+def record_server_timing(name, labels, seconds):
+    # Stages timed on the request thread add up into that request's phases;
+    # work on pool threads (no request context) only reaches /metrics.
+    if name != "stage_duration_seconds" or not has_request_context():
+        return
+    timings = g.get("timings")
+    phase = STAGE_PHASES.get(labels.get("stage"))
+    if timings is not None and phase:
+        timings[phase] += seconds
+
+
+METRICS.add_listener(record_server_timing)
+
+# Shared pool so concurrent batch requests cannot open unbounded Grok calls.
+AI_EXECUTOR = ThreadPoolExecutor(max_workers=AI_WORKERS)
+# Separate pool for queued jobs so job work never starves request fan-out.
+JOBS = JobQueue(JOBS_DIR, workers=JOB_WORKERS, ttl=JOB_TTL)
+JOBS.add_lane("upload", UPLOAD_JOB_WORKERS, max_jobs=UPLOAD_JOB_QUEUE_SIZE, max_bytes=UPLOAD_JOB_MAX_BYTES)
+
+
 def parse_json_object(text):
     if not text:
         return None
@@ -174,6 +361,22 @@ def parse_json_object(text):
         return None
 
 
+def has_json_object(text):
+    # Cache check for replies read with parse_json_object.
+    return parse_json_object(text) is not None
+
+
+def parse_json_lists(text, keys):
+    # A strict JSON object whose `keys` all hold lists, or None.
+    try:
+        parsed = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(parsed, dict) and all(isinstance(parsed.get(key), list) for key in keys):
+        return parsed
+    return None
+
+
 def parse_date(value):
     if isinstance(value, datetime):
         return value.date()
@@ -217,6 +420,12 @@ def parse_date_range(value):
         return None
 
 
+def parse_form_date(value):
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
 def iter_days(start, end):
     cur = start
     while cur <= end:
@@ -312,6 +521,58 @@ def normalize_text(value):
     return s
 
 
+def answer_tokens(value):
+    return [t for t in re.findall(r"[a-z0-9]+", normalize_text(value)) if len(t) >= 2]
+
+
+def char_ngrams(tokens, n=3):
+    text = f" {' '.join(tokens)} "
+    return Counter(text[i : i + n] for i in range(len(text) - n + 1))
+
+
+def lexical_similarity(ideal_answer, user_answer):
+    ideal_tokens = answer_tokens(ideal_answer)
+    user_tokens = answer_tokens(user_answer)
+    if not ideal_tokens or not user_tokens:
+        return 0.0
+    if ideal_tokens == user_tokens:
+        return 1.0
+
+    ideal_set = set(ideal_tokens)
+    user_set = set(user_tokens)
+    overlap = len(ideal_set & user_set)
+    precision = overlap / len(user_set)
+    recall = overlap / len(ideal_set)
+    token_f1 = 2 * precision * recall / (precision + recall) if overlap else 0.0
+
+    ideal_grams = char_ngrams(ideal_tokens)
+    user_grams = char_ngrams(user_tokens)
+    dot = sum(count * user_grams[gram] for gram, count in ideal_grams.items())
+    norm = math.sqrt(sum(c * c for c in ideal_grams.values())) * math.sqrt(sum(c * c for c in user_grams.values()))
+    cosine = dot / norm if norm else 0.0
+
+    return (token_f1 + cosine) / 2
+
+
+def score_answer_locally(ideal_answer, user_answer, threshold):
+    score = lexical_similarity(ideal_answer, user_answer)
+    if score >= min(1.0, threshold + EVAL_LOCAL_HIGH_MARGIN):
+        return {
+            "correct": True,
+            "score": score,
+            "feedback": "Answer closely matches the ideal answer.",
+            "source": "local",
+        }
+    if EVAL_LOCAL_LOW_MARGIN is not None and score <= max(0.0, threshold - EVAL_LOCAL_LOW_MARGIN):
+        return {
+            "correct": False,
+            "score": score,
+            "feedback": "Answer does not cover the key points of the ideal answer.",
+            "source": "local",
+        }
+    return None
+
+
 def extract_chat_messages(chat):
     messages = []
     if not chat:
@@ -351,6 +612,98 @@ def score_keywords(messages, keywords):
     return max(0, min(100, int(ratio * 500)))
 
 
+PROMPT_STAT_FIELDS = (
+    "sales",
+    "bonus",
+    "tips",
+    "ppv_sales",
+    "dm_sales",
+    "dm_sent",
+    "fans_chatted",
+    "fans_spent",
+    "clocked_hours",
+    "scheduled_hours",
+    "sales_per_hour",
+    "messages_per_hour",
+    "fans_per_hour",
+    "response_clock_avg",
+    "response_sched_avg",
+)
+
+PROMPT_CHAT_FIELDS = (
+    "messages_sent",
+    "paid_offers",
+    "purchased",
+    "purchase_revenue",
+    "reply_time_avg",
+    "unique_fans",
+    "conversion_rate",
+)
+
+
+def round_prompt_value(value):
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def project_stats(stats, fields=PROMPT_STAT_FIELDS):
+    return {key: round_prompt_value(stats.get(key)) for key in fields if stats.get(key) is not None}
+
+
+def project_chat(chat, sample_limit=AI_PROMPT_SAMPLES):
+    if not chat:
+        return None
+    projected = project_stats(chat, PROMPT_CHAT_FIELDS)
+    projected["top_sentences"] = [x.get("text") for x in chat.get("top_sentences") or []][:sample_limit]
+    projected["top_baits"] = [x.get("text") for x in chat.get("top_baits") or []][:sample_limit]
+    return projected
+
+
+def project_compare(compare):
+    if not compare:
+        return None
+    return {
+        key: round(value["percentile"])
+        for key, value in compare.items()
+        if value and value.get("percentile") is not None
+    }
+
+
+def project_employee(emp):
+    # Only the summary metrics a prompt needs; shifts and daily series are dropped.
+    projected = {"name": emp.get("employee") or emp.get("name")}
+    projected.update(project_stats(emp))
+    chat = project_chat(emp.get("chat"))
+    if chat:
+        projected["chat"] = chat
+    percentiles = project_compare(emp.get("compare"))
+    if percentiles:
+        projected["percentiles"] = percentiles
+    return projected
+
+
+def compact_prompt(endpoint, original, projected, samples=()):
+    # Serialize the projected payload, dropping sample lines (longest list
+    # first) until it fits AI_PROMPT_BUDGET characters.
+    before = len(json.dumps(original, ensure_ascii=False, default=str))
+    text = json.dumps(projected, ensure_ascii=False)
+    samples = [x for x in samples if isinstance(x, list)]
+    while len(text) > AI_PROMPT_BUDGET:
+        longest = max(samples, key=len, default=None)
+        if not longest:
+            break
+        longest.pop()
+        text = json.dumps(projected, ensure_ascii=False)
+    app.logger.info("AI prompt %s: %d -> %d chars", endpoint, before, len(text))
+    return text
+
+
+def employee_samples(projected):
+    chat = projected.get("chat") or {}
+    return [chat.get("top_sentences"), chat.get("top_baits")]
+
+
 def build_fallback_chat_feedback(emp, tos_flags):
     chat = emp.get("chat") or {}
     messages = extract_chat_messages(chat)
@@ -392,92 +745,120 @@ def build_fallback_chat_feedback(emp, tos_flags):
     }
 
 
-def build_ai_chat_feedback(emp, top_peers, ai_enabled=True):
-    chat = emp.get("chat")
-    if not chat:
-        return None
-
-    messages = extract_chat_messages(chat)
-    tos_flags = detect_tos_flags(messages)
-
-    if not ai_enabled or not GROK_API_KEY:
-        return build_fallback_chat_feedback(emp, tos_flags)
-
+def build_chat_feedback_messages(emp, top_peers, tos_flags, messages):
     peer_payload = []
     for peer in top_peers or []:
+        peer_chat = project_chat(peer.get("chat")) or {}
         peer_payload.append(
             {
                 "name": peer.get("employee") or peer.get("name"),
-                "sales": peer.get("sales"),
-                "conversion_rate": (peer.get("chat") or {}).get("conversion_rate"),
-                "top_baits": [x.get("text") for x in (peer.get("chat") or {}).get("top_baits", [])],
-                "top_sentences": [x.get("text") for x in (peer.get("chat") or {}).get("top_sentences", [])],
+                "sales": round_prompt_value(peer.get("sales")),
+                "conversion_rate": round_prompt_value(peer_chat.get("conversion_rate")),
+                "top_baits": peer_chat.get("top_baits", []),
+                "top_sentences": peer_chat.get("top_sentences", []),
             }
         )
 
-    payload = {
-        "model": GROK_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "You are a supportive performance coach for an OnlyFans chatter team. "
-                    "Analyze the chatter's messages and metrics compared to top performers. "
-                    "Return ONLY valid JSON with keys: summary (string), strengths (array), improvements (array), "
-                    "risk_score (0-100), greedy_score (0-100), fantasy_score (0-100), tos_flags (array). "
-                    "Keep wording constructive and non-judgmental."
-                ),
-            },
-            {
-                "role": "user",
-                "content": json.dumps(
-                    {
-                        "chatter": emp,
-                        "top_peers": peer_payload,
-                        "tos_flags_detected": tos_flags,
-                        "message_samples": messages[:20],
-                    }
-                ),
-            },
-        ],
-        "temperature": 0.2,
-        "max_tokens": 350,
+    chatter = project_employee(emp)
+    message_samples = messages[:20]
+    samples = [message_samples] + employee_samples(chatter)
+    for peer in peer_payload:
+        samples.extend([peer["top_baits"], peer["top_sentences"]])
+    user_content = compact_prompt(
+        "chat_feedback",
+        {"chatter": emp, "top_peers": top_peers, "message_samples": messages},
+        {
+            "chatter": chatter,
+            "top_peers": peer_payload,
+            "tos_flags_detected": tos_flags,
+            "message_samples": message_samples,
+        },
+        samples,
+    )
+
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a supportive performance coach for an OnlyFans chatter team. "
+                "Analyze the chatter's messages and metrics compared to top performers. "
+                "Return ONLY valid JSON with keys: summary (string), strengths (array), improvements (array), "
+                "risk_score (0-100), greedy_score (0-100), fantasy_score (0-100), tos_flags (array). "
+                "Keep wording constructive and non-judgmental."
+            ),
+        },
+        {"role": "user", "content": user_content},
+    ]
+
+
+def parse_chat_feedback(content, tos_flags):
+    parsed = parse_json_object(content) or {}
+    strengths = parsed.get("strengths") if isinstance(parsed.get("strengths"), list) else []
+    improvements = parsed.get("improvements") if isinstance(parsed.get("improvements"), list) else []
+    summary = parsed.get("summary") if isinstance(parsed.get("summary"), str) else ""
+    tos_flags_resp = parsed.get("tos_flags") if isinstance(parsed.get("tos_flags"), list) else []
+    risk_score = int(parsed.get("risk_score") or 0)
+    greedy_score = int(parsed.get("greedy_score") or 0)
+    fantasy_score = int(parsed.get("fantasy_score") or 0)
+
+    merged_flags = []
+    for item in tos_flags + tos_flags_resp:
+        if isinstance(item, str) and item not in merged_flags:
+            merged_flags.append(item)
+
+    return {
+        "summary": summary or "Feedback generated from chat samples and metrics.",
+        "strengths": strengths,
+        "improvements": improvements,
+        "tos_flags": merged_flags,
+        "risk_score": max(0, min(100, risk_score)),
+        "greedy_score": max(0, min(100, greedy_score)),
+        "fantasy_score": max(0, min(100, fantasy_score)),
     }
 
+
+def is_chat_feedback(content):
+    # Cache check: a reply parse_chat_feedback can read, scores included.
+    if parse_json_object(content) is None:
+        return False
     try:
-        response = requests.post(
-            build_grok_url(),
-            headers={"Authorization": f"Bearer {GROK_API_KEY}"},
-            json=payload,
-            timeout=25,
-        )
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        parsed = parse_json_object(content) or {}
-        strengths = parsed.get("strengths") if isinstance(parsed.get("strengths"), list) else []
-        improvements = parsed.get("improvements") if isinstance(parsed.get("improvements"), list) else []
-        summary = parsed.get("summary") if isinstance(parsed.get("summary"), str) else ""
-        tos_flags_resp = parsed.get("tos_flags") if isinstance(parsed.get("tos_flags"), list) else []
-        risk_score = int(parsed.get("risk_score") or 0)
-        greedy_score = int(parsed.get("greedy_score") or 0)
-        fantasy_score = int(parsed.get("fantasy_score") or 0)
-
-        merged_flags = []
-        for item in tos_flags + tos_flags_resp:
-            if isinstance(item, str) and item not in merged_flags:
-                merged_flags.append(item)
+        parse_chat_feedback(content, [])
+    except (TypeError, ValueError):
+        return False
+    return True
 
-        return {
-            "summary": summary or "Feedback generated from chat samples and metrics.",
-            "strengths": strengths,
-            "improvements": improvements,
-            "tos_flags": merged_flags,
-            "risk_score": max(0, min(100, risk_score)),
-            "greedy_score": max(0, min(100, greedy_score)),
-            "fantasy_score": max(0, min(100, fantasy_score)),
-        }
-    except Exception:
+
+def build_ai_chat_feedback(emp, top_peers, ai_enabled=True):
+    chat = emp.get("chat")
+    if not chat:
+        return None
+
+    messages = extract_chat_messages(chat)
+    tos_flags = detect_tos_flags(messages)
+
+    if not ai_enabled:
+        return build_fallback_chat_feedback(emp, tos_flags)
+    if not GROK_API_KEY:
+        GROK.record_outcome("chat_feedback", fallback="no_key")
+        return build_fallback_chat_feedback(emp, tos_flags)
+
+    grok_messages = build_chat_feedback_messages(emp, top_peers, tos_flags, messages)
+    try:
+        content, cache_status = GROK.complete(
+            "chat_feedback", grok_messages, max_tokens=350, timeout=25, validate=is_chat_feedback
+        )
+    except Exception as exc:
+        GROK.record_outcome("chat_feedback", fallback=failure_reason(exc))
         return build_fallback_chat_feedback(emp, tos_flags)
+    try:
+        feedback = parse_chat_feedback(content, tos_flags)
+    except (TypeError, ValueError):
+        # e.g. a non-numeric risk_score
+        GROK.record_outcome("chat_feedback", parsed=False, fallback="parse_error")
+        return build_fallback_chat_feedback(emp, tos_flags)
+    GROK.record_outcome("chat_feedback", parsed=parse_json_object(content) is not None)
+    feedback["cache"] = cache_status
+    return feedback
 
 
 def build_insights(stats):
@@ -505,68 +886,86 @@ def build_insights(stats):
     return insights
 
 
-def build_ai_insights(stats, ai_enabled=True):
-    if not ai_enabled or not GROK_API_KEY:
-        return build_insights(stats)
+def parse_insights(content):
+    try:
+        insights = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(insights, list) and all(isinstance(x, str) for x in insights):
+        return insights
+    return None
+
+
+def request_ai_insights(stats, record=None):
+    # Returns the model's insights, or None if the reply is malformed; raises on call errors.
+    # record replaces GROK.record_outcome (see enrich_with_ai).
+    record = record or GROK.record_outcome
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You analyze worker performance based strictly on the provided numeric metrics. "
+                "Do not infer personal activities or off-platform behavior. "
+                "Return 2-4 concise bullet points as a JSON array of strings. "
+                "Focus on measurable gaps and actionable improvements."
+            ),
+        },
+        {"role": "user", "content": compact_prompt("insights", stats, project_stats(stats))},
+    ]
+
+    content = GROK.chat(
+        "insights", messages, max_tokens=200, timeout=15, validate=lambda text: parse_insights(text) is not None
+    )
+    insights = parse_insights(content)
+    if insights is not None:
+        record("insights", parsed=True)
+        return insights
+    record("insights", parsed=False, fallback="parse_error")
+    return None
 
-    payload = {
-        "model": GROK_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "You analyze worker performance based strictly on the provided numeric metrics. "
-                    "Do not infer personal activities or off-platform behavior. "
-                    "Return 2-4 concise bullet points as a JSON array of strings. "
-                    "Focus on measurable gaps and actionable improvements."
-                ),
-            },
-            {
-                "role": "user",
-                "content": json.dumps(
-                    {
-                        "sales": stats["sales"],
-                        "bonus": stats["bonus"],
-                        "tips": stats["tips"],
-                        "ppv_sales": stats["ppv_sales"],
-                        "dm_sales": stats["dm_sales"],
-                        "dm_sent": stats["dm_sent"],
-                        "fans_chatted": stats["fans_chatted"],
-                        "fans_spent": stats["fans_spent"],
-                        "clocked_hours": stats["clocked_hours"],
-                        "scheduled_hours": stats["scheduled_hours"],
-                        "sales_per_hour": stats["sales_per_hour"],
-                        "messages_per_hour": stats["messages_per_hour"],
-                        "fans_per_hour": stats["fans_per_hour"],
-                        "response_clock_avg": stats["response_clock_avg"],
-                        "response_sched_avg": stats["response_sched_avg"],
-                    }
-                ),
-            },
-        ],
-        "temperature": 0.2,
-        "max_tokens": 200,
-    }
 
+def build_ai_insights(stats, ai_enabled=True):
+    if not ai_enabled:
+        return build_insights(stats)
+    if not GROK_API_KEY:
+        GROK.record_outcome("insights", fallback="no_key")
+        return build_insights(stats)
     try:
-        response = requests.post(
-            build_grok_url(),
-            headers={"Authorization": f"Bearer {GROK_API_KEY}"},
-            json=payload,
-            timeout=15,
-        )
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        insights = json.loads(content)
-        if isinstance(insights, list) and all(isinstance(x, str) for x in insights):
-            return insights
-    except Exception:
+        return request_ai_insights(stats) or build_insights(stats)
+    except Exception as exc:
+        GROK.record_outcome("insights", fallback=failure_reason(exc))
         return build_insights(stats)
 
-    return build_insights(stats)
+
+SALES_ROW_FIELDS = (
+    (TIPS_HEADER, "tips", parse_money),
+    (PPV_SALES_HEADER, "ppv_sales", parse_money),
+    (DM_SALES_HEADER, "dm_sales", parse_money),
+    (DM_SENT_HEADER, "dm_sent", parse_number),
+    (FANS_CHATTED_HEADER, "fans_chatted", parse_number),
+    (FANS_SPENT_HEADER, "fans_spent", parse_number),
+    (CLOCKED_HOURS_HEADER, "clocked_hours", parse_hours),
+    (SCHED_HOURS_HEADER, "scheduled_hours", parse_hours),
+    (SALES_PER_HOUR_HEADER, "sales_per_hour", parse_money),
+    (MSGS_PER_HOUR_HEADER, "messages_per_hour", parse_number),
+    (FANS_PER_HOUR_HEADER, "fans_per_hour", parse_number),
+    (RESP_CLOCK_HEADER, "response_clock", parse_minutes),
+    (RESP_SCHED_HEADER, "response_sched", parse_minutes),
+    (GROUP_HEADER, "group", None),
+    (CREATORS_HEADER, "creators", None),
+)
 
 
 def extract_stats(file_stream, date_from=None, date_to=None):
+    return aggregate_stats(parse_sales_rows(file_stream), date_from, date_to)
+
+
+@METRICS.timed("stage_duration_seconds", stage="parse_sales")
+def parse_sales_rows(file_stream, progress=None):
+    # Reads the workbook once into plain rows so any date range can be
+    # aggregated later without openpyxl. Fields for missing columns are None.
+    # progress, if given, is called with the number of rows scanned since its
+    # previous call (every PROGRESS_ROWS rows and once at the end).
     wb = load_workbook(file_stream, data_only=True)
     # Prefer per-day sheet when workbook includes both totals and per-day tabs.
     ws = wb.active
@@ -576,19 +975,23 @@ def extract_stats(file_stream, date_from=None, date_to=None):
             break
 
     headers = [ws.cell(1, c).value for c in range(1, ws.max_column + 1)]
-    idx = {h: i + 1 for i, h in enumerate(headers)}
+    idx = {h: i for i, h in enumerate(headers)}
 
     for required in (DATE_HEADER, EMP_HEADER, SALES_HEADER):
         if required not in idx:
             raise ValueError(f"Missing column: {required}")
 
+    fields = [(key, idx[header], parse) for header, key, parse in SALES_ROW_FIELDS if header in idx]
     min_date = None
     max_date = None
     rows = []
 
-    for r in range(2, ws.max_row + 1):
-        raw_date = ws.cell(r, idx[DATE_HEADER]).value
-        date_range = parse_date_range(raw_date)
+    scanned = 0
+    for values in ws.iter_rows(min_row=2, max_col=len(headers), values_only=True):
+        scanned += 1
+        if progress is not None and scanned % PROGRESS_ROWS == 0:
+            progress(PROGRESS_ROWS)
+        date_range = parse_date_range(values[idx[DATE_HEADER]])
         if date_range is None:
             continue
         range_start, range_end = date_range
@@ -598,11 +1001,29 @@ def extract_stats(file_stream, date_from=None, date_to=None):
         if max_date is None or range_end > max_date:
             max_date = range_end
 
-        rows.append((r, range_start, range_end))
-
+        emp = values[idx[EMP_HEADER]]
+        if emp is None:
+            continue
+        row = dict.fromkeys(key for _, key, _ in SALES_ROW_FIELDS)
+        row.update(start=range_start, end=range_end, employee=emp, sales=parse_money(values[idx[SALES_HEADER]]))
+        for key, col, parse in fields:
+            row[key] = parse(values[col]) if parse else values[col]
+        rows.append(row)
+
+    if progress is not None:
+        progress(scanned % PROGRESS_ROWS)
+    METRICS.inc("rows_total", len(rows), sheet="sales", result="parsed")
+    METRICS.inc("rows_total", scanned - len(rows), sheet="sales", result="skipped")
     if min_date is None or max_date is None:
         raise ValueError("No valid dates found in the sheet.")
 
+    return {"min_date": min_date, "max_date": max_date, "rows": rows}
+
+
+@METRICS.timed("stage_duration_seconds", stage="aggregate_sales")
+def aggregate_stats(parsed, date_from=None, date_to=None):
+    min_date = parsed["min_date"]
+    max_date = parsed["max_date"]
     if date_from is None:
         date_from = min_date
     if date_to is None:
@@ -611,9 +1032,12 @@ def extract_stats(file_stream, date_from=None, date_to=None):
     stats = {}
     per_day = {}
     per_day_bonus = {}
+    per_day_hours = {}
     shifts = {}
 
-    for r, range_start, range_end in rows:
+    for row in parsed["rows"]:
+        range_start = row["start"]
+        range_end = row["end"]
         if range_end < date_from or range_start > date_to:
             continue
         overlap_start = max(range_start, date_from)
@@ -624,13 +1048,8 @@ def extract_stats(file_stream, date_from=None, date_to=None):
         overlap_days = (overlap_end - overlap_start).days + 1
         fraction = overlap_days / total_days if total_days else 1.0
 
-        emp = ws.cell(r, idx[EMP_HEADER]).value
-        if emp is None:
-            continue
-
-        sales_val = ws.cell(r, idx[SALES_HEADER]).value
-        sales_raw = parse_money(sales_val)
-        sales = sales_raw * fraction
+        emp = row["employee"]
+        sales = row["sales"] * fraction
 
         if emp not in stats:
             stats[emp] = {
@@ -652,60 +1071,36 @@ def extract_stats(file_stream, date_from=None, date_to=None):
             }
             per_day[emp] = {}
             per_day_bonus[emp] = {}
+            per_day_hours[emp] = {}
             shifts[emp] = []
 
-        stats[emp]["sales"] += sales
-
-        if TIPS_HEADER in idx:
-            stats[emp]["tips"] += parse_money(ws.cell(r, idx[TIPS_HEADER]).value) * fraction
-        if PPV_SALES_HEADER in idx:
-            stats[emp]["ppv_sales"] += parse_money(ws.cell(r, idx[PPV_SALES_HEADER]).value) * fraction
-        if DM_SALES_HEADER in idx:
-            stats[emp]["dm_sales"] += parse_money(ws.cell(r, idx[DM_SALES_HEADER]).value) * fraction
-        if DM_SENT_HEADER in idx:
-            stats[emp]["dm_sent"] += (parse_number(ws.cell(r, idx[DM_SENT_HEADER]).value) or 0.0) * fraction
-        if FANS_CHATTED_HEADER in idx:
-            stats[emp]["fans_chatted"] += (parse_number(ws.cell(r, idx[FANS_CHATTED_HEADER]).value) or 0.0) * fraction
-        if FANS_SPENT_HEADER in idx:
-            stats[emp]["fans_spent"] += (parse_number(ws.cell(r, idx[FANS_SPENT_HEADER]).value) or 0.0) * fraction
-
-        if CLOCKED_HOURS_HEADER in idx:
-            stats[emp]["clocked_hours"] += parse_hours(ws.cell(r, idx[CLOCKED_HOURS_HEADER]).value) * fraction
-        if SCHED_HOURS_HEADER in idx:
-            stats[emp]["scheduled_hours"] += parse_hours(ws.cell(r, idx[SCHED_HOURS_HEADER]).value) * fraction
-
-        if SALES_PER_HOUR_HEADER in idx:
-            v = parse_money(ws.cell(r, idx[SALES_PER_HOUR_HEADER]).value)
-            if v:
-                stats[emp]["sales_per_hour_vals"].append(v)
-        if MSGS_PER_HOUR_HEADER in idx:
-            v = parse_number(ws.cell(r, idx[MSGS_PER_HOUR_HEADER]).value)
-            if v:
-                stats[emp]["messages_per_hour_vals"].append(v)
-        if FANS_PER_HOUR_HEADER in idx:
-            v = parse_number(ws.cell(r, idx[FANS_PER_HOUR_HEADER]).value)
-            if v:
-                stats[emp]["fans_per_hour_vals"].append(v)
-
-        if RESP_CLOCK_HEADER in idx:
-            v = parse_minutes(ws.cell(r, idx[RESP_CLOCK_HEADER]).value)
-            if v is not None:
-                stats[emp]["response_clock_vals"].append(v)
-        if RESP_SCHED_HEADER in idx:
-            v = parse_minutes(ws.cell(r, idx[RESP_SCHED_HEADER]).value)
-            if v is not None:
-                stats[emp]["response_sched_vals"].append(v)
+        data = stats[emp]
+        data["sales"] += sales
+        for key in ("tips", "ppv_sales", "dm_sales", "dm_sent", "fans_chatted", "fans_spent", "scheduled_hours"):
+            data[key] += (row[key] or 0.0) * fraction
+        clocked = (row["clocked_hours"] or 0.0) * fraction
+        data["clocked_hours"] += clocked
+
+        for key in ("sales_per_hour", "messages_per_hour", "fans_per_hour"):
+            if row[key]:
+                data[f"{key}_vals"].append(row[key])
+        for key in ("response_clock", "response_sched"):
+            if row[key] is not None:
+                data[f"{key}_vals"].append(row[key])
 
         sales_per_day = sales / overlap_days if overlap_days else sales
+        hours_per_day = clocked / overlap_days if overlap_days else clocked
         for day in iter_days(overlap_start, overlap_end):
             day_key = day.isoformat()
             per_day[emp].setdefault(day_key, 0.0)
             per_day[emp][day_key] += sales_per_day
+            per_day_hours[emp].setdefault(day_key, 0.0)
+            per_day_hours[emp][day_key] += hours_per_day
             shifts[emp].append(
                 {
                     "date": day_key,
-                    "group": ws.cell(r, idx[GROUP_HEADER]).value if GROUP_HEADER in idx else None,
-                    "creators": ws.cell(r, idx[CREATORS_HEADER]).value if CREATORS_HEADER in idx else None,
+                    "group": row["group"],
+                    "creators": row["creators"],
                     "sales": sales_per_day,
                     "bonus": 0.0,
                 }
@@ -769,6 +1164,7 @@ def extract_stats(file_stream, date_from=None, date_to=None):
                 "response_sched_avg": avg_resp_sched,
                 "daily_sales": per_day.get(emp, {}),
                 "daily_bonus": per_day_bonus.get(emp, {}),
+                "daily_hours": per_day_hours.get(emp, {}),
                 "shifts": shifts.get(emp, []),
             }
         )
@@ -780,7 +1176,10 @@ def extract_stats(file_stream, date_from=None, date_to=None):
     }
 
 
-def extract_chat_stats(file_stream, date_from=None, date_to=None):
+@METRICS.timed("stage_duration_seconds", stage="parse_chat")
+def parse_chat_rows(file_stream, progress=None):
+    # Same idea as parse_sales_rows: one pass over the sheet, keeping only the
+    # parsed values (and the normalized message key) that aggregation needs.
     wb = load_workbook(file_stream, data_only=True, read_only=True)
     ws = wb.active
 
@@ -796,11 +1195,13 @@ def extract_chat_stats(file_stream, date_from=None, date_to=None):
 
     min_date = None
     max_date = None
+    rows = []
 
-    stats = {}
-    global_baits = {}
-
+    scanned = 0
     for row in ws.iter_rows(min_row=2, values_only=True):
+        scanned += 1
+        if progress is not None and scanned % PROGRESS_ROWS == 0:
+            progress(PROGRESS_ROWS)
         raw_date = row[idx[CHAT_SENT_DATE_HEADER]]
         row_date = parse_chat_date(raw_date)
         if row_date is None:
@@ -811,11 +1212,6 @@ def extract_chat_stats(file_stream, date_from=None, date_to=None):
         if max_date is None or row_date > max_date:
             max_date = row_date
 
-        if date_from and row_date < date_from:
-            continue
-        if date_to and row_date > date_to:
-            continue
-
         sender = row[idx[CHAT_SENDER_HEADER]]
         if sender is None:
             continue
@@ -829,18 +1225,55 @@ def extract_chat_stats(file_stream, date_from=None, date_to=None):
         creator_msg = clean_text(creator_msg)
 
         price_val = row[idx[CHAT_PRICE_HEADER]] if CHAT_PRICE_HEADER in idx else None
-        price = parse_money(price_val)
 
         purchased_val = row[idx[CHAT_PURCHASED_HEADER]] if CHAT_PURCHASED_HEADER in idx else None
         purchased = str(purchased_val).strip().lower() if purchased_val is not None else ""
-        purchased_yes = purchased in ("yes", "y", "true", "1")
 
         reply_val = row[idx[CHAT_REPLY_HEADER]] if CHAT_REPLY_HEADER in idx else None
-        reply_min = parse_minutes(reply_val)
 
         sent_to = row[idx[CHAT_SENT_TO_HEADER]] if CHAT_SENT_TO_HEADER in idx else None
         sent_to = str(sent_to).strip() if sent_to is not None else ""
 
+        rows.append(
+            {
+                "date": row_date,
+                "sender": sender,
+                "message": creator_msg,
+                "key": normalize_text(creator_msg) if creator_msg else "",
+                "price": parse_money(price_val),
+                "purchased": purchased in ("yes", "y", "true", "1"),
+                "reply_min": parse_minutes(reply_val),
+                "sent_to": sent_to,
+            }
+        )
+
+    if progress is not None:
+        progress(scanned % PROGRESS_ROWS)
+    METRICS.inc("rows_total", len(rows), sheet="chat", result="parsed")
+    METRICS.inc("rows_total", scanned - len(rows), sheet="chat", result="skipped")
+    if min_date is None or max_date is None:
+        raise ValueError("No valid dates found in chat sheet.")
+
+    return {"min_date": min_date, "max_date": max_date, "rows": rows}
+
+
+@METRICS.timed("stage_duration_seconds", stage="aggregate_chat")
+def aggregate_chat_stats(parsed, date_from=None, date_to=None):
+    stats = {}
+    global_baits = {}
+
+    for row in parsed["rows"]:
+        row_date = row["date"]
+        if date_from and row_date < date_from:
+            continue
+        if date_to and row_date > date_to:
+            continue
+
+        sender = row["sender"]
+        creator_msg = row["message"]
+        key = row["key"]
+        price = row["price"]
+
         if sender not in stats:
             stats[sender] = {
                 "messages_sent": 0,
@@ -857,7 +1290,6 @@ def extract_chat_stats(file_stream, date_from=None, date_to=None):
 
         if creator_msg:
             data["messages_sent"] += 1
-            key = normalize_text(creator_msg)
             if key:
                 if key not in data["sentences"]:
                     data["sentences"][key] = {"text": creator_msg, "count": 0}
@@ -865,37 +1297,30 @@ def extract_chat_stats(file_stream, date_from=None, date_to=None):
 
         if price > 0:
             data["paid_offers"] += 1
-            if creator_msg:
-                key = normalize_text(creator_msg)
-                if key:
-                    if key not in data["baits"]:
-                        data["baits"][key] = {"text": creator_msg, "count": 0}
-                    data["baits"][key]["count"] += 1
-                    if key not in global_baits:
-                        global_baits[key] = {"text": creator_msg, "count": 0, "purchased": 0}
-                    global_baits[key]["count"] += 1
-
-        if purchased_yes:
+            if key:
+                if key not in data["baits"]:
+                    data["baits"][key] = {"text": creator_msg, "count": 0}
+                data["baits"][key]["count"] += 1
+                if key not in global_baits:
+                    global_baits[key] = {"text": creator_msg, "count": 0, "purchased": 0}
+                global_baits[key]["count"] += 1
+
+        if row["purchased"]:
             data["purchased"] += 1
             data["purchase_revenue"] += price
-            if creator_msg:
-                key = normalize_text(creator_msg)
-                if key:
-                    if key not in data["baits"]:
-                        data["baits"][key] = {"text": creator_msg, "count": 0}
-                    data["baits"][key]["count"] += 1
-                    if key not in global_baits:
-                        global_baits[key] = {"text": creator_msg, "count": 0, "purchased": 0}
-                    global_baits[key]["purchased"] += 1
-
-        if reply_min is not None:
-            data["reply_time_vals"].append(reply_min)
-
-        if sent_to:
-            data["unique_fans"].add(sent_to)
+            if key:
+                if key not in data["baits"]:
+                    data["baits"][key] = {"text": creator_msg, "count": 0}
+                data["baits"][key]["count"] += 1
+                if key not in global_baits:
+                    global_baits[key] = {"text": creator_msg, "count": 0, "purchased": 0}
+                global_baits[key]["purchased"] += 1
 
-    if min_date is None or max_date is None:
-        raise ValueError("No valid dates found in chat sheet.")
+        if row["reply_min"] is not None:
+            data["reply_time_vals"].append(row["reply_min"])
+
+        if row["sent_to"]:
+            data["unique_fans"].add(row["sent_to"])
 
     chatters = []
     for sender, data in stats.items():
@@ -928,8 +1353,8 @@ def extract_chat_stats(file_stream, date_from=None, date_to=None):
         )
 
     return {
-        "min_date": min_date.isoformat(),
-        "max_date": max_date.isoformat(),
+        "min_date": parsed["min_date"].isoformat(),
+        "max_date": parsed["max_date"].isoformat(),
         "chatters": chatters,
         "global_baits": global_baits,
     }
@@ -965,6 +1390,7 @@ def build_ppv_month(global_baits):
     }
 
 
+@METRICS.timed("stage_duration_seconds", stage="compare")
 def build_peer_compare(employees):
     def pct(values, value, higher_better=True):
         values = [v for v in values if v is not None]
@@ -1006,10 +1432,68 @@ def build_peer_compare(employees):
         emp["compare"] = compare
 
 
-def build_ai_chatter_summary(emp, ai_enabled=True):
-    chat = emp.get("chat")
-    if not chat:
-        return None
+LEADERBOARD_METRICS = ("sales", "bonus", "sales_per_hour")
+LEADERBOARD_WINDOWS = (7, 30)
+LEADERBOARD_TOP = 20
+
+
+def rolling_sums(values, window):
+    prefix = [0.0]
+    for value in values:
+        prefix.append(prefix[-1] + value)
+    return [prefix[i + 1] - prefix[max(0, i + 1 - window)] for i in range(len(values))]
+
+
+@METRICS.timed("stage_duration_seconds", stage="leaderboard")
+def build_leaderboards(employees, series_start, day_from, day_to, windows, top_k=LEADERBOARD_TOP):
+    # Windows may reach back before day_from, so series start at the first day in the file.
+    days = [d.isoformat() for d in iter_days(series_start, day_to)]
+    offset = max(0, (day_from - series_start).days)
+
+    series = []
+    for emp in employees:
+        daily_sales = emp.get("daily_sales") or {}
+        daily_bonus = emp.get("daily_bonus") or {}
+        daily_hours = emp.get("daily_hours") or {}
+        series.append(
+            (
+                emp["employee"],
+                [daily_sales.get(d, 0.0) for d in days],
+                [daily_bonus.get(d, 0.0) for d in days],
+                [daily_hours.get(d, 0.0) for d in days],
+            )
+        )
+
+    leaderboards = {}
+    for window in windows:
+        rolled = []
+        for name, sales, bonus, hours in series:
+            rolled.append((name, rolling_sums(sales, window), rolling_sums(bonus, window), rolling_sums(hours, window)))
+
+        boards = {metric: [] for metric in LEADERBOARD_METRICS}
+        for i in range(offset, len(days)):
+            candidates = {metric: [] for metric in LEADERBOARD_METRICS}
+            for name, sales, bonus, hours in rolled:
+                if sales[i] > 0:
+                    candidates["sales"].append((sales[i], name))
+                if bonus[i] > 0:
+                    candidates["bonus"].append((bonus[i], name))
+                if hours[i] > 0 and sales[i] > 0:
+                    candidates["sales_per_hour"].append((sales[i] / hours[i], name))
+            for metric in LEADERBOARD_METRICS:
+                top = heapq.nlargest(top_k, candidates[metric])
+                boards[metric].append(
+                    {
+                        "date": days[i],
+                        "top": [{"employee": name, "value": value} for value, name in top],
+                    }
+                )
+        leaderboards[str(window)] = boards
+
+    return leaderboards
+
+
+def fallback_chatter_summary(ai_enabled):
     if not ai_enabled or not GROK_API_KEY:
         return {
             "why_money": ["AI is off; showing metrics and top messages."],
@@ -1017,73 +1501,6 @@ def build_ai_chatter_summary(emp, ai_enabled=True):
             "ppv_suggestions": ["Increase PPV volume and test the top 2 baits."],
             "bait_suggestions": ["Align copy with baits that convert."],
         }
-
-    payload = {
-        "model": GROK_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "You analyze chatter performance based strictly on the provided metrics and text. "
-                    "Do not infer personal activities or off-platform behavior. "
-                    "Return a JSON object with keys: why_money (array), how_money (array), "
-                    "ppv_suggestions (array), bait_suggestions (array). "
-                    "Each array should have 2-4 concise bullet strings."
-                ),
-            },
-            {
-                "role": "user",
-                "content": json.dumps(
-                    {
-                        "sales": emp.get("sales"),
-                        "ppv_sales": emp.get("ppv_sales"),
-                        "dm_sales": emp.get("dm_sales"),
-                        "sales_per_hour": emp.get("sales_per_hour"),
-                        "messages_per_hour": emp.get("messages_per_hour"),
-                        "fans_per_hour": emp.get("fans_per_hour"),
-                        "response_clock_avg": emp.get("response_clock_avg"),
-                        "chat_messages_sent": chat.get("messages_sent"),
-                        "chat_paid_offers": chat.get("paid_offers"),
-                        "chat_purchased": chat.get("purchased"),
-                        "chat_conversion_rate": chat.get("conversion_rate"),
-                        "chat_reply_time_avg": chat.get("reply_time_avg"),
-                        "top_sentences": [x["text"] for x in chat.get("top_sentences", [])],
-                        "top_baits": [x["text"] for x in chat.get("top_baits", [])],
-                        "compare": emp.get("compare"),
-                    }
-                ),
-            },
-        ],
-        "temperature": 0.2,
-        "max_tokens": 250,
-    }
-
-    try:
-        response = requests.post(
-            build_grok_url(),
-            headers={"Authorization": f"Bearer {GROK_API_KEY}"},
-            json=payload,
-            timeout=15,
-        )
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        summary = json.loads(content)
-        if (
-            isinstance(summary, dict)
-            and isinstance(summary.get("why_money"), list)
-            and isinstance(summary.get("how_money"), list)
-            and isinstance(summary.get("ppv_suggestions"), list)
-            and isinstance(summary.get("bait_suggestions"), list)
-        ):
-            return summary
-    except Exception:
-        return {
-            "why_money": ["AI is unavailable; use the metrics and top messages below."],
-            "how_money": ["Compare PPV/DM performance and use the best bait copy."],
-            "ppv_suggestions": ["Test 2-3 PPV offers with stronger CTAs."],
-            "bait_suggestions": ["Reuse the top bait messages from the list."],
-        }
-
     return {
         "why_money": ["AI is unavailable; use the metrics and top messages below."],
         "how_money": ["Compare PPV/DM performance and use the best bait copy."],
@@ -1092,7 +1509,82 @@ def build_ai_chatter_summary(emp, ai_enabled=True):
     }
 
 
+def build_ai_chatter_summary(emp, ai_enabled=True):
+    if not emp.get("chat"):
+        return None
+    if not ai_enabled:
+        return fallback_chatter_summary(False)
+    if not GROK_API_KEY:
+        GROK.record_outcome("chatter_summary", fallback="no_key")
+        return fallback_chatter_summary(False)
+    try:
+        return request_ai_chatter_summary(emp) or fallback_chatter_summary(True)
+    except Exception as exc:
+        GROK.record_outcome("chatter_summary", fallback=failure_reason(exc))
+        return fallback_chatter_summary(True)
+
+
+def request_ai_chatter_summary(emp, record=None):
+    # Returns the model's summary, or None if the reply is malformed; raises on call errors.
+    # record replaces GROK.record_outcome (see enrich_with_ai).
+    record = record or GROK.record_outcome
+    chat = emp.get("chat")
+    projected = project_stats(
+        emp,
+        ("sales", "ppv_sales", "dm_sales", "sales_per_hour", "messages_per_hour", "fans_per_hour", "response_clock_avg"),
+    )
+    projected.update(
+        {
+            "chat_messages_sent": chat.get("messages_sent"),
+            "chat_paid_offers": chat.get("paid_offers"),
+            "chat_purchased": chat.get("purchased"),
+            "chat_conversion_rate": round_prompt_value(chat.get("conversion_rate")),
+            "chat_reply_time_avg": round_prompt_value(chat.get("reply_time_avg")),
+            "top_sentences": [x["text"] for x in chat.get("top_sentences", [])][:AI_PROMPT_SAMPLES],
+            "top_baits": [x["text"] for x in chat.get("top_baits", [])][:AI_PROMPT_SAMPLES],
+            "compare": project_compare(emp.get("compare")),
+        }
+    )
+    user_content = compact_prompt(
+        "chatter_summary",
+        emp,
+        projected,
+        [projected["top_sentences"], projected["top_baits"]],
+    )
+
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You analyze chatter performance based strictly on the provided metrics and text. "
+                "Do not infer personal activities or off-platform behavior. "
+                "Return a JSON object with keys: why_money (array), how_money (array), "
+                "ppv_suggestions (array), bait_suggestions (array). "
+                "Each array should have 2-4 concise bullet strings."
+            ),
+        },
+        {"role": "user", "content": user_content},
+    ]
+
+    keys = ("why_money", "how_money", "ppv_suggestions", "bait_suggestions")
+    content = GROK.chat(
+        "chatter_summary",
+        messages,
+        max_tokens=250,
+        timeout=15,
+        validate=lambda text: parse_json_lists(text, keys) is not None,
+    )
+    summary = parse_json_lists(content, keys)
+    if summary is not None:
+        record("chatter_summary", parsed=True)
+        return summary
+    record("chatter_summary", parsed=False, fallback="parse_error")
+    return None
+
+
 def build_ai_pair_summary(user_a, user_b, ai_enabled=True):
+    if ai_enabled and not GROK_API_KEY:
+        GROK.record_outcome("pair_summary", fallback="no_key")
     if not ai_enabled or not GROK_API_KEY:
         return {
             "why_a_wins": ["Compare sales, PPV output, and reply time."],
@@ -1101,47 +1593,44 @@ def build_ai_pair_summary(user_a, user_b, ai_enabled=True):
             "bait_recommendations": ["B should use A's top baits and iterate the copy."],
         }
 
-    payload = {
-        "model": GROK_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "Compare two chatters using only the provided metrics and text. "
-                    "Return JSON with keys: why_a_wins (array), why_b_lags (array), "
-                    "ppv_recommendations (array), bait_recommendations (array). "
-                    "Each array should have 2-4 concise bullet strings. "
-                    "Focus on measurable gaps and actionable PPV/bait improvements for user B."
-                ),
-            },
-            {
-                "role": "user",
-                "content": json.dumps({"user_a": user_a, "user_b": user_b}),
-            },
-        ],
-        "temperature": 0.2,
-        "max_tokens": 250,
-    }
+    projected_a = project_employee(user_a)
+    projected_b = project_employee(user_b)
+    user_content = compact_prompt(
+        "pair_summary",
+        {"user_a": user_a, "user_b": user_b},
+        {"user_a": projected_a, "user_b": projected_b},
+        employee_samples(projected_a) + employee_samples(projected_b),
+    )
+
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "Compare two chatters using only the provided metrics and text. "
+                "Return JSON with keys: why_a_wins (array), why_b_lags (array), "
+                "ppv_recommendations (array), bait_recommendations (array). "
+                "Each array should have 2-4 concise bullet strings. "
+                "Focus on measurable gaps and actionable PPV/bait improvements for user B."
+            ),
+        },
+        {"role": "user", "content": user_content},
+    ]
 
     try:
-        response = requests.post(
-            build_grok_url(),
-            headers={"Authorization": f"Bearer {GROK_API_KEY}"},
-            json=payload,
+        keys = ("why_a_wins", "why_b_lags", "ppv_recommendations", "bait_recommendations")
+        content = GROK.chat(
+            "pair_summary",
+            messages,
+            max_tokens=250,
             timeout=15,
+            validate=lambda text: parse_json_lists(text, keys) is not None,
         )
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        summary = json.loads(content)
-        if (
-            isinstance(summary, dict)
-            and isinstance(summary.get("why_a_wins"), list)
-            and isinstance(summary.get("why_b_lags"), list)
-            and isinstance(summary.get("ppv_recommendations"), list)
-            and isinstance(summary.get("bait_recommendations"), list)
-        ):
+        summary = parse_json_lists(content, keys)
+        if summary is not None:
+            GROK.record_outcome("pair_summary", parsed=True)
             return summary
-    except Exception:
+    except Exception as exc:
+        GROK.record_outcome("pair_summary", fallback=failure_reason(exc))
         return {
             "why_a_wins": ["A has stronger sales/hr and better reply time."],
             "why_b_lags": ["B has lower CVR or fewer paid offers."],
@@ -1149,6 +1638,7 @@ def build_ai_pair_summary(user_a, user_b, ai_enabled=True):
             "bait_recommendations": ["B should copy A's top 2 baits and adjust tone."],
         }
 
+    GROK.record_outcome("pair_summary", parsed=False, fallback="parse_error")
     return {
         "why_a_wins": ["A has stronger sales/hr and better reply time."],
         "why_b_lags": ["B has lower CVR or fewer paid offers."],
@@ -1157,13 +1647,382 @@ def build_ai_pair_summary(user_a, user_b, ai_enabled=True):
     }
 
 
+@METRICS.timed("stage_duration_seconds", stage="ai")
+def enrich_with_ai(employees, budget):
+    # Each call collects its outcomes instead of recording them, and they are
+    # recorded only for calls that finished within the budget: one still
+    # running at the deadline gets the "deadline" fallback and nothing else.
+    futures = {}
+    outcomes = {}
+
+    def submit(key, fn, emp):
+        collected = outcomes[key] = []
+        futures[key] = AI_EXECUTOR.submit(fn, emp, lambda endpoint, **outcome: collected.append((endpoint, outcome)))
+
+    for i, emp in enumerate(employees):
+        submit((i, "insights"), request_ai_insights, emp)
+        if emp.get("chat"):
+            submit((i, "chat_ai"), request_ai_chatter_summary, emp)
+    wait(list(futures.values()), timeout=budget)
+
+    for i, emp in enumerate(employees):
+        source = {}
+        for kind in ("insights", "chat_ai"):
+            future = futures.get((i, kind))
+            result = None
+            if future is not None:
+                endpoint = "insights" if kind == "insights" else "chatter_summary"
+                if not future.done():
+                    future.cancel()
+                    GROK.record_outcome(endpoint, fallback="deadline")
+                else:
+                    for outcome_endpoint, outcome in outcomes[(i, kind)]:
+                        GROK.record_outcome(outcome_endpoint, **outcome)
+                    if future.exception():
+                        GROK.record_outcome(endpoint, fallback=failure_reason(future.exception()))
+                    else:
+                        result = future.result()
+            if result:
+                emp[kind] = result
+                source[kind] = "ai"
+            elif kind == "insights":
+                emp[kind] = build_insights(emp)
+                source[kind] = "fallback"
+            else:
+                emp[kind] = fallback_chatter_summary(True) if emp.get("chat") else None
+                source[kind] = "fallback" if emp.get("chat") else None
+        emp["source"] = source
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
 
+def estimate_dataset_bytes(dataset):
+    # Rough in-memory size of the parsed rows, for the dataset store's bound.
+    size = len(dataset["sales"]["rows"]) * DATASET_ROW_BYTES
+    if dataset["chat"]:
+        size += sum(DATASET_ROW_BYTES + 2 * len(row["message"] or "") for row in dataset["chat"]["rows"])
+    return size
+
+
+def estimate_upload_cost(sales_bytes, chat_bytes=None):
+    cost = estimate_parse_bytes(sales_bytes, SALES_CELL_BYTES)
+    if chat_bytes is not None:
+        cost += estimate_parse_bytes(chat_bytes, CHAT_CELL_BYTES)
+    return cost
+
+
+def build_analysis(dataset, date_from=None, date_to=None):
+    data = aggregate_stats(dataset["sales"], date_from, date_to)
+    if not data["employees"]:
+        raise ValueError("No rows found for selected date range.")
+
+    if dataset["chat"]:
+        chat_data = aggregate_chat_stats(dataset["chat"], date_from, date_to)
+        chat_by_sender = {c["sender"]: c for c in chat_data["chatters"]}
+        data["ppv_day"] = build_ppv_month(chat_data.get("global_baits", {}))
+        for emp in data["employees"]:
+            emp["chat"] = chat_by_sender.get(emp["employee"])
+    else:
+        for emp in data["employees"]:
+            emp["chat"] = None
+        data["ppv_day"] = {"ass": [], "tits": [], "overall": []}
+
+    build_peer_compare(data["employees"])
+    return data
+
+
+EMPLOYEE_SUMMARY_FIELDS = ("employee",) + PROMPT_STAT_FIELDS
+EMPLOYEE_FIELDS = EMPLOYEE_SUMMARY_FIELDS + (
+    "daily_sales",
+    "daily_bonus",
+    "daily_hours",
+    "shifts",
+    "chat",
+    "compare",
+    "insights",
+    "chat_ai",
+    "source",
+)
+DAILY_FIELDS = ("daily_sales", "daily_bonus", "daily_hours")
+SHIFT_COLUMNS = ("group", "creators", "sales", "bonus")
+
+
+def read_analysis_view(payload=None):
+    # Projection/paging parameters come from the query string, falling back to
+    # the JSON body (payload) or the multipart form. Returns None when absent.
+    source = payload if payload is not None else request.form
+
+    def get(key):
+        return request.args.get(key) or source.get(key)
+
+    names = request.args.getlist("employees")
+    if not names:
+        value = source.get("employees") if payload is not None else source.getlist("employees")
+        names = [value] if isinstance(value, str) else list(value or [])
+
+    fields = get("fields")
+    sort = get("sort")
+    offset = get("offset")
+    limit = get("limit")
+    encoding = get("encoding")
+    if not (fields or names or sort or offset or limit or encoding):
+        return None
+    if encoding not in (None, "", "json", "columnar"):
+        raise ValueError(f"Unknown encoding: {encoding}")
+
+    view = {
+        "fields": None,
+        "employees": names or None,
+        "sort": None,
+        "offset": 0,
+        "limit": None,
+        "columnar": encoding == "columnar",
+    }
+    if fields:
+        selected = ["employee"]
+        for name in (fields.split(",") if isinstance(fields, str) else fields):
+            name = name.strip()
+            expanded = EMPLOYEE_SUMMARY_FIELDS if name == "summary" else (name,)
+            for field in expanded:
+                if field not in EMPLOYEE_FIELDS:
+                    raise ValueError(f"Unknown field: {field}")
+                if field not in selected:
+                    selected.append(field)
+        view["fields"] = selected
+    if sort:
+        key = sort.lstrip("-")
+        if key not in EMPLOYEE_SUMMARY_FIELDS:
+            raise ValueError(f"Cannot sort by: {key}")
+        view["sort"] = (key, sort.startswith("-"))
+    try:
+        view["offset"] = max(0, int(offset or 0))
+        view["limit"] = max(0, int(limit)) if limit not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ValueError("offset and limit must be integers")
+    return view
+
+
+def project_analysis(data, view):
+    # Applies employees= filtering, sorting (None values last), paging and
+    # fields= projection without touching the stored analysis.
+    if view is None:
+        return data
+    employees = data["employees"]
+    if view["employees"]:
+        wanted = set(view["employees"])
+        employees = [emp for emp in employees if emp["employee"] in wanted]
+    if view["sort"]:
+        key, descending = view["sort"]
+        present = [emp for emp in employees if emp.get(key) is not None]
+        present.sort(key=lambda emp: emp[key], reverse=descending)
+        employees = present + [emp for emp in employees if emp.get(key) is None]
+
+    total = len(employees)
+    end = view["offset"] + view["limit"] if view["limit"] is not None else None
+    employees = employees[view["offset"] : end]
+    if view["fields"]:
+        employees = [{k: emp[k] for k in view["fields"] if k in emp} for emp in employees]
+
+    body = dict(data)
+    body.update(employees=employees, total_employees=total, offset=view["offset"], limit=view["limit"])
+    return encode_columnar(body) if view["columnar"] else body
+
+
+def encode_columnar(body):
+    # Lossless compact form: one shared, sorted date axis; the per-day maps
+    # become arrays aligned to it (null = no entry) and shifts become column
+    # arrays whose "date" column holds indexes into the axis.
+    days = set()
+    for emp in body["employees"]:
+        for key in DAILY_FIELDS:
+            days.update(emp.get(key) or ())
+        days.update(shift["date"] for shift in emp.get("shifts") or ())
+    axis = sorted(days)
+    position = {day: i for i, day in enumerate(axis)}
+
+    employees = []
+    for emp in body["employees"]:
+        emp = dict(emp)
+        for key in DAILY_FIELDS:
+            if key in emp:
+                values = [None] * len(axis)
+                for day, value in emp[key].items():
+                    values[position[day]] = value
+                emp[key] = values
+        if "shifts" in emp:
+            shifts = emp["shifts"]
+            columns = {"date": [position[shift["date"]] for shift in shifts]}
+            for column in SHIFT_COLUMNS:
+                columns[column] = [shift[column] for shift in shifts]
+            emp["shifts"] = columns
+        employees.append(emp)
+    return dict(body, encoding="columnar", dates=axis, employees=employees)
+
+
+def current_ai_status(ai_enabled):
+    if not ai_enabled:
+        return "disabled"
+    if not GROK_API_KEY:
+        return "no_key"
+    return "circuit_open" if GROK.breaker.is_open() else "enabled"
+
+
+def stable_analysis_id(dataset_id, date_from, date_to, ai_status, ai_budget):
+    # Without merged AI output an analysis is a pure function of the dataset,
+    # range and AI status, so it gets a stable id and its responses get ETags.
+    if ai_status == "enabled" and ai_budget > 0:
+        return None
+    return hash_key(["analysis", dataset_id, str(date_from), str(date_to), ai_status, ai_budget > 0])[:32]
+
+
+def view_etag(analysis_id, view):
+    return hash_key(["etag", analysis_id, view])[:32]
+
+
+def matching_etag(tag):
+    # Returns the If-None-Match entry that matches tag, if any. Compressed
+    # responses carry an encoding suffix (see compress_response). "*" matches
+    # any current representation, so callers only ask once the resource is
+    # known to exist.
+    if request.if_none_match.star_tag:
+        return tag
+    for candidate in request.if_none_match.as_set():
+        if candidate.split("-")[0] == tag:
+            return candidate
+    return None
+
+
+def not_modified(tag):
+    response = Response(status=304)
+    response.set_etag(tag)
+    return response
+
+
+@METRICS.timed("stage_duration_seconds", stage="serialize")
+def analysis_response(data, view, etag=None, store=False):
+    # The full result is stored; the response may be a projection of it.
+    body = project_analysis(data, view)
+    response = jsonify(body)
+    if store:
+        size = response.content_length if body is data else len(json.dumps(data))
+        if not store_analysis(data, size):
+            body["analysis_id"] = None
+            etag = None
+            response = jsonify(body)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def store_analysis(data, size):
+    # Clears analysis_id when the store refuses the entry (too large, TTL 0).
+    if ANALYSES.put(data["analysis_id"], data, size or 0):
+        return True
+    data["analysis_id"] = None
+    return False
+
+
+def compute_analysis(dataset_id, dataset, date_from, date_to, ai_status, ai_budget, analysis_id=None):
+    data = build_analysis(dataset, date_from, date_to)
+    data["dataset_id"] = dataset_id
+
+    # By default keep /api/analyze fast and reliable with non-AI insights; AI
+    # coaching is fetched per chatter via /api/employee-feedback. Clients that
+    # pass ai_budget get whatever AI output finishes within that many seconds.
+    if ai_status == "enabled" and ai_budget > 0:
+        enrich_with_ai(data["employees"], min(ai_budget, AI_BATCH_DEADLINE))
+    else:
+        for emp in data["employees"]:
+            emp["insights"] = build_insights(emp)
+            emp["chat_ai"] = build_ai_chatter_summary(emp, False)
+            if ai_budget > 0:
+                emp["source"] = {"insights": "fallback", "chat_ai": "fallback" if emp.get("chat") else None}
+
+    data["ai_status"] = ai_status
+    data["analysis_id"] = analysis_id or ANALYSES.new_id()
+    return data
+
+
+def respond_with_analysis(dataset_id, load_dataset, date_from, date_to, ai_enabled, ai_budget, view):
+    ai_status = current_ai_status(ai_enabled)
+    analysis_id = stable_analysis_id(dataset_id, date_from, date_to, ai_status, ai_budget)
+    etag = None
+    if analysis_id:
+        etag = view_etag(analysis_id, view)
+        data = ANALYSES.find(analysis_id)
+        if data is not None:
+            matched = matching_etag(etag)
+            if matched:
+                return not_modified(matched)
+            return analysis_response(data, view, etag)
+
+    data = compute_analysis(dataset_id, load_dataset(), date_from, date_to, ai_status, ai_budget, analysis_id)
+    return analysis_response(data, view, etag, store=True)
+
+
+def upload_dataset_id(sales_bytes, chat_bytes):
+    # Content-derived id: uploading the same files again reuses the parsed rows.
+    return hash_key(
+        [
+            "dataset",
+            hashlib.sha256(sales_bytes).hexdigest(),
+            hashlib.sha256(chat_bytes).hexdigest() if chat_bytes is not None else None,
+        ]
+    )[:32]
+
+
+def load_upload_dataset(dataset_id, sales_bytes, chat_bytes, tracker=None):
+    # Keep the parsed rows so /api/requery can change the range without
+    # re-uploading. tracker (an UploadProgress) follows a background job.
+    dataset = DATASETS.find(dataset_id)
+    if dataset is not None:
+        return dataset
+    open_stream = tracker.stream if tracker else io.BytesIO
+    on_rows = tracker.add_rows if tracker else None
+    if tracker:
+        tracker.set_stage("waiting_for_capacity")
+    with ADMISSION.admit(estimate_upload_cost(sales_bytes, chat_bytes)):
+        if tracker:
+            tracker.set_stage("parse_sales")
+        dataset = {"sales": parse_sales_rows(open_stream(sales_bytes), on_rows), "chat": None}
+        if chat_bytes is not None:
+            if tracker:
+                tracker.set_stage("parse_chat")
+            dataset["chat"] = parse_chat_rows(open_stream(chat_bytes), on_rows)
+    DATASETS.put(dataset_id, dataset, estimate_dataset_bytes(dataset))
+    return dataset
+
+
+def analyze_upload_job(payload, control):
+    # Background /api/analyze: same result as the synchronous path, with
+    # progress (stage, bytes, rows, ETA) on the job record and cancellation.
+    sales_bytes = payload["sales_bytes"]
+    chat_bytes = payload["chat_bytes"]
+    total_rows = workbook_rows(sales_bytes) + (workbook_rows(chat_bytes) if chat_bytes is not None else 0)
+    tracker = UploadProgress(
+        control.report, control.check, len(sales_bytes) + len(chat_bytes or b""), total_rows
+    )
+    dataset_id = payload["dataset_id"]
+    dataset = load_upload_dataset(dataset_id, sales_bytes, chat_bytes, tracker)
+
+    date_from, date_to, ai_budget = payload["date_from"], payload["date_to"], payload["ai_budget"]
+    ai_status = current_ai_status(payload["ai_enabled"])
+    analysis_id = stable_analysis_id(dataset_id, date_from, date_to, ai_status, ai_budget)
+    data = ANALYSES.find(analysis_id) if analysis_id else None
+    if data is None:
+        tracker.set_stage("aggregate")
+        data = compute_analysis(dataset_id, dataset, date_from, date_to, ai_status, ai_budget, analysis_id)
+        tracker.set_stage("serialize")
+        store_analysis(data, len(json.dumps(data)))
+    return project_analysis(data, payload["view"])
+
+
 @app.route("/api/analyze", methods=["POST"])
 def analyze():
+    dataset_id = None
     try:
         if "file" not in request.files:
             return jsonify({"error": "Missing file"}), 400
@@ -1175,48 +2034,320 @@ def analyze():
         date_from = request.form.get("date_from")
         date_to = request.form.get("date_to")
         ai_enabled = request.form.get("ai_enabled", "false").lower() == "true"
+        ai_budget = float(request.form.get("ai_budget") or 0)
+
+        df = parse_form_date(date_from)
+        dt = parse_form_date(date_to)
+        view = read_analysis_view()
+
+        sales_bytes = file.read()
+        chat_bytes = chat_file.read() if chat_file and chat_file.filename else None
+        METRICS.inc("upload_bytes_total", len(sales_bytes), sheet="sales")
+        if chat_bytes is not None:
+            METRICS.inc("upload_bytes_total", len(chat_bytes), sheet="chat")
+        dataset_id = upload_dataset_id(sales_bytes, chat_bytes)
+
+        if wants_async(request.form):
+            # Large workbooks: parse in the background and report progress.
+            payload = {
+                "dataset_id": dataset_id,
+                "sales_bytes": sales_bytes,
+                "chat_bytes": chat_bytes,
+                "date_from": df,
+                "date_to": dt,
+                "ai_enabled": ai_enabled,
+                "ai_budget": ai_budget,
+                "view": view,
+            }
+            cost = estimate_upload_cost(sales_bytes, chat_bytes)
+            job = JOBS.submit("analyze", analyze_upload_job, payload, tracked=True, lane="upload", cost=cost)
+            return jsonify(dict(job_links(job), dataset_id=dataset_id)), 202
 
-        df = None
-        dt = None
-        if date_from:
-            df = datetime.strptime(date_from, "%Y-%m-%d").date()
-        if date_to:
-            dt = datetime.strptime(date_to, "%Y-%m-%d").date()
+        def load_dataset():
+            return load_upload_dataset(dataset_id, sales_bytes, chat_bytes)
 
-        data = extract_stats(io.BytesIO(file.read()), df, dt)
-        if not data["employees"]:
-            return jsonify({"error": "No rows found for selected date range."}), 400
+        return respond_with_analysis(dataset_id, load_dataset, df, dt, ai_enabled, ai_budget, view)
+    except (AdmissionRejected, JobQueueFull):
+        raise
+    except Exception as exc:
+        return jsonify({"error": str(exc), "dataset_id": dataset_id}), 400
 
-        if chat_file and chat_file.filename:
-            chat_data = extract_chat_stats(io.BytesIO(chat_file.read()), df, dt)
-            chat_by_sender = {c["sender"]: c for c in chat_data["chatters"]}
-            data["ppv_day"] = build_ppv_month(chat_data.get("global_baits", {}))
-            for emp in data["employees"]:
-                emp["chat"] = chat_by_sender.get(emp["employee"])
-        else:
-            for emp in data["employees"]:
-                emp["chat"] = None
-            data["ppv_day"] = {"ass": [], "tits": [], "overall": []}
 
-        build_peer_compare(data["employees"])
+@app.route("/api/requery", methods=["POST"])
+def requery():
+    payload = request.get_json(silent=True) or {}
+    dataset_id = payload.get("dataset_id")
+    if not dataset_id:
+        return jsonify({"error": "Missing dataset_id"}), 400
+    dataset = DATASETS.get(dataset_id)
+
+    try:
+        df = parse_form_date(payload.get("date_from"))
+        dt = parse_form_date(payload.get("date_to"))
+        ai_enabled = str(payload.get("ai_enabled")).lower() in ("1", "true", "yes")
+        ai_budget = float(payload.get("ai_budget") or 0)
+        view = read_analysis_view(payload)
+        return respond_with_analysis(dataset_id, lambda: dataset, df, dt, ai_enabled, ai_budget, view)
     except Exception as exc:
         return jsonify({"error": str(exc)}), 400
 
-    ai_status = "disabled"
-    if ai_enabled and not GROK_API_KEY:
-        ai_status = "no_key"
-    if ai_enabled and GROK_API_KEY:
-        ai_status = "enabled"
 
-    # Keep /api/analyze fast and reliable: compute non-AI insights here.
-    # AI coaching is fetched per chatter via /api/employee-feedback.
-    for emp in data["employees"]:
-        emp["insights"] = build_insights(emp)
-        emp["chat_ai"] = build_ai_chatter_summary(emp, False)
+@app.route("/api/analysis/<analysis_id>", methods=["GET"])
+def get_analysis(analysis_id):
+    # Re-reads a stored analysis with the same fields/employees/sort/paging
+    # parameters, e.g. ?employees=Name&fields=shifts to load shifts lazily.
+    try:
+        view = read_analysis_view({})
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    data = ANALYSES.get(analysis_id)
+    etag = view_etag(analysis_id, view)
+    matched = matching_etag(etag)
+    if matched:
+        return not_modified(matched)
+    return analysis_response(data, view, etag)
+
+
+def wants_profile():
+    if not PROFILE_TOKEN:
+        return False
+    token = request.headers.get("X-Profile") or request.args.get("profile") or ""
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    incoming = request.headers.get("X-Request-ID", "")
+    g.request_id = incoming if valid_request_id(incoming) else uuid.uuid4().hex
+    g.timings = dict.fromkeys(SERVER_TIMING_PHASES, 0.0)
+    profiled = request.endpoint not in (None, "get_profile") and wants_profile()
+    g.profiler = PROFILES.start() if profiled else None
+    if g.profiler is not None:
+        g.profile_id = new_profile_id(g.request_id)
+
+
+# Registered before compress_response so it runs after it (Flask calls
+# after_request hooks in reverse) and the duration includes compression.
+# For streamed responses the total stops when the headers go out.
+@app.after_request
+def record_request_duration(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    METRICS.observe(
+        "http_request_duration_seconds",
+        total,
+        route=request.url_rule.rule if request.url_rule else "unmatched",
+        method=request.method,
+        status=response.status_code,
+    )
+    timing = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in g.timings.items()]
+    timing.append(f"total;dur={total * 1000:.1f}")
+    if g.get("profiler") is not None:
+        timing.append(f'profile;desc="{g.profile_id}"')
+    response.headers["Server-Timing"] = ", ".join(timing)
+    response.headers["X-Request-ID"] = g.request_id
+    return response
+
+
+@app.teardown_request
+def finish_profile(exc):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        PROFILES.finish(profiler, g.profile_id)
+
+
+@app.after_request
+def compress_response(response):
+    # Negotiated brotli/gzip for buffered API responses above COMPRESS_MIN_BYTES.
+    # Streams (SSE) are left alone. A strong ETag gets an encoding suffix
+    # because the compressed bytes are a different representation.
+    if (
+        not request.path.startswith("/api/")
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return response
+
+    accept = request.accept_encodings
+    if brotli is not None and accept.quality("br") > 0:
+        encoding = "br"
+        body = brotli.compress(response.get_data(), quality=BROTLI_QUALITY)
+    elif accept.quality("gzip") > 0:
+        encoding = "gzip"
+        body = gzip.compress(response.get_data(), compresslevel=GZIP_LEVEL)
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    tag, weak = response.get_etag()
+    if tag:
+        response.set_etag(f"{tag}-{encoding}", weak)
+    return response
+
+
+@app.route("/api/leaderboard", methods=["POST"])
+def leaderboard():
+    try:
+        if "file" not in request.files:
+            return jsonify({"error": "Missing file"}), 400
+        file = request.files["file"]
+        if not file.filename:
+            return jsonify({"error": "Empty filename"}), 400
 
-    data["ai_status"] = ai_status
+        df = parse_form_date(request.form.get("date_from"))
+        dt = parse_form_date(request.form.get("date_to"))
+        raw_windows = request.form.get("windows") or ",".join(str(w) for w in LEADERBOARD_WINDOWS)
+        windows = sorted({int(w) for w in raw_windows.split(",") if w.strip()})
+        if not windows or windows[0] < 1:
+            return jsonify({"error": "Windows must be positive day counts"}), 400
+        top_k = max(1, int(request.form.get("top") or LEADERBOARD_TOP))
+
+        # Parse the whole file so trailing windows can reach before date_from.
+        content = file.read()
+        METRICS.inc("upload_bytes_total", len(content), sheet="sales")
+        with ADMISSION.admit(estimate_upload_cost(content)):
+            data = extract_stats(io.BytesIO(content))
+        if not data["employees"]:
+            return jsonify({"error": "No rows found in file."}), 400
 
-    return jsonify(data)
+        min_date = parse_date(data["min_date"])
+        max_date = parse_date(data["max_date"])
+        day_from = max(df or min_date, min_date)
+        day_to = min(dt or max_date, max_date)
+        if day_to < day_from:
+            return jsonify({"error": "No rows found for selected date range."}), 400
+
+        boards = build_leaderboards(data["employees"], min_date, day_from, day_to, windows, top_k)
+    except AdmissionRejected:
+        raise
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    with METRICS.time("stage_duration_seconds", stage="serialize"):
+        return jsonify(
+            {
+                "min_date": data["min_date"],
+                "max_date": data["max_date"],
+                "date_from": day_from.isoformat(),
+                "date_to": day_to.isoformat(),
+                "windows": windows,
+                "metrics": list(LEADERBOARD_METRICS),
+                "top": top_k,
+                "leaderboards": boards,
+            }
+        )
+
+
+@app.errorhandler(AdmissionRejected)
+@app.errorhandler(JobQueueFull)
+def admission_rejected(exc):
+    response = jsonify({"error": str(exc), "retry_after": exc.retry_after})
+    response.headers["Retry-After"] = str(exc.retry_after)
+    return response, 429
+
+
+@app.route("/api/admission-stats", methods=["GET"])
+def admission_stats():
+    return jsonify(dict(ADMISSION.stats(), upload_jobs=JOBS.lane_stats("upload")))
+
+
+def collect_cache_metrics():
+    caches = [("analysis", ANALYSES.stats()), ("dataset", DATASETS.stats())]
+    if GROK.cache is not None:
+        caches.append(("ai", GROK.cache.stats()))
+    yield "cache_lookups_total", "counter", "Cache lookups by cache and the tier that answered (or miss).", [
+        ("", {"cache": cache, "result": result}, count)
+        for cache, stats in caches
+        for result, count in stats["lookups"].items()
+    ]
+    yield "cache_items", "gauge", "Entries held in this process's memory tier.", [
+        ("", {"cache": cache}, stats["items"]) for cache, stats in caches
+    ]
+
+
+def collect_ai_metrics():
+    stats = GROK.stats()
+    events, outcomes, fallbacks, tokens, cost, latency = [], [], [], [], [], []
+    for endpoint, entry in sorted(stats.items()):
+        for event in ("calls", "errors", "retries", "rejected", "coalesced", "cancelled"):
+            events.append(("", {"endpoint": endpoint, "event": event}, entry[event]))
+        outcomes.append(("", {"endpoint": endpoint, "outcome": "parsed"}, entry["parsed"]))
+        outcomes.append(("", {"endpoint": endpoint, "outcome": "parse_failure"}, entry["parse_failures"]))
+        for reason, count in sorted(entry["fallbacks"].items()):
+            fallbacks.append(("", {"endpoint": endpoint, "reason": reason}, count))
+        tokens.append(("", {"endpoint": endpoint, "kind": "prompt"}, entry["prompt_tokens"]))
+        tokens.append(("", {"endpoint": endpoint, "kind": "completion"}, entry["completion_tokens"]))
+        cost.append(("", {"endpoint": endpoint}, entry["cost_usd"]))
+        for bound, count in entry["latency_histogram_ms"].items():
+            le = bound if bound == "+Inf" else str(int(bound) / 1000)
+            latency.append(("_bucket", {"endpoint": endpoint, "le": le}, count))
+        latency.append(("_sum", {"endpoint": endpoint}, round(entry["latency_ms_total"] / 1000, 6)))
+        latency.append(("_count", {"endpoint": endpoint}, entry["calls"]))
+    events_help = "Grok calls, errors, retries, breaker rejections, coalesced waits and caller-closed streams."
+    yield "ai_events_total", "counter", events_help, events
+    yield "ai_outcomes_total", "counter", "Whether Grok replies could be parsed.", outcomes
+    yield "ai_fallbacks_total", "counter", "Responses served without AI output, by reason.", fallbacks
+    yield "ai_tokens_total", "counter", "Grok tokens used.", tokens
+    yield "ai_cost_usd_total", "counter", "Estimated Grok spend.", cost
+    yield "ai_call_duration_seconds", "histogram", "Grok call latency.", latency
+    yield "ai_breaker_open", "gauge", "1 while the Grok circuit breaker is open.", [
+        ("", {}, int(GROK.breaker.snapshot()["state"] == "open"))
+    ]
+
+
+def collect_admission_metrics():
+    stats = ADMISSION.stats()
+    yield "admission_in_flight", "gauge", "Workbook parses running.", [("", {}, stats["in_flight"])]
+    yield "admission_in_flight_bytes", "gauge", "Estimated memory of running parses.", [
+        ("", {}, stats["in_flight_bytes"])
+    ]
+    yield "admission_queue_depth", "gauge", "Parses waiting for admission.", [("", {}, stats["queue_depth"])]
+    yield "admission_requests_total", "counter", "Parse admission decisions.", [
+        ("", {"result": result}, stats[result]) for result in ("admitted", "rejected", "timed_out")
+    ]
+
+
+METRICS.add_collector(collect_cache_metrics)
+METRICS.add_collector(collect_ai_metrics)
+METRICS.add_collector(collect_admission_metrics)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/profiles/<profile_id>", methods=["GET"])
+def get_profile(profile_id):
+    # Text summary of a stored profile (?sort=tottime, ?limit=N), or the raw
+    # pstats file with ?format=prof for snakeviz/pstats. Needs the profile token.
+    if not wants_profile():
+        return jsonify({"error": "profiling_disabled"}), 403
+    if request.args.get("format") == "prof":
+        path = PROFILES.path(profile_id)
+        if path is None:
+            return jsonify({"error": "profile_not_found"}), 404
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True)
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "calls", "ncalls"):
+        return jsonify({"error": "Invalid sort"}), 400
+    try:
+        limit = max(1, int(request.args.get("limit") or 40))
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    summary = PROFILES.summary(profile_id, sort=sort, limit=limit)
+    if summary is None:
+        return jsonify({"error": "profile_not_found"}), 404
+    return Response(summary, mimetype="text/plain")
 
 
 @app.route("/api/ai-test", methods=["POST"])
@@ -1224,38 +2355,195 @@ def ai_test():
     if not GROK_API_KEY:
         return jsonify({"ok": False, "error": "Missing GROK_API_KEY"}), 400
 
-    payload = {
-        "model": GROK_MODEL,
-        "messages": [
-            {"role": "system", "content": "Reply with a JSON array: [\"ok\"]"},
-            {"role": "user", "content": "ping"},
-        ],
-        "temperature": 0.0,
-        "max_tokens": 20,
-    }
+    messages = [
+        {"role": "system", "content": "Reply with a JSON array: [\"ok\"]"},
+        {"role": "user", "content": "ping"},
+    ]
 
     try:
-        response = requests.post(
-            build_grok_url(),
-            headers={"Authorization": f"Bearer {GROK_API_KEY}"},
-            json=payload,
-            timeout=10,
-        )
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
+        content = GROK.chat("ai_test", messages, max_tokens=20, timeout=10, temperature=0.0, use_cache=False)
         parsed = json.loads(content)
         if isinstance(parsed, list) and parsed and parsed[0] == "ok":
-            return jsonify({"ok": True})
-        return jsonify({"ok": False, "error": "Unexpected response"}), 400
+            return jsonify({"ok": True, "breaker": GROK.breaker.snapshot()})
+        return jsonify({"ok": False, "error": "Unexpected response", "breaker": GROK.breaker.snapshot()}), 400
     except Exception as exc:
-        return jsonify({"ok": False, "error": str(exc)}), 400
+        return jsonify({"ok": False, "error": str(exc), "breaker": GROK.breaker.snapshot()}), 400
+
+
+@app.route("/api/ai-stats", methods=["GET"])
+def ai_stats():
+    return jsonify(
+        {
+            "model": GROK.model,
+            "endpoints": GROK.stats(),
+            "breaker": GROK.breaker.snapshot(),
+            "coalesced": GROK.coalesced_total(),
+        }
+    )
+
+
+def parse_eval_result(parsed):
+    try:
+        score = float(parsed.get("score"))
+    except Exception:
+        score = 0.0
+    score = max(0.0, min(1.0, score))
+    feedback = parsed.get("feedback") if isinstance(parsed.get("feedback"), str) else "Answer evaluated."
+    return score, feedback
+
+
+def parse_eval_threshold(value):
+    try:
+        if value is not None:
+            return float(value)
+    except (TypeError, ValueError):
+        pass
+    return GROK_THRESHOLD
+
+
+def grade_cache_key(question, ideal_answer, user_answer):
+    return hash_key(
+        ["grade", GROK_MODEL, normalize_text(question), normalize_text(ideal_answer), normalize_text(user_answer)]
+    )
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def format_eval_item(item_id, question, ideal_answer, user_answer):
+    return json.dumps(
+        {"id": item_id, "question": question, "ideal_answer": ideal_answer, "user_answer": user_answer},
+        ensure_ascii=False,
+    )
+
+
+def pack_eval_items(pending):
+    # Greedily fill each model call up to the prompt budget and item cap.
+    chunks = []
+    current = []
+    used = 0
+    for item in pending:
+        cost = estimate_tokens(item["line"])
+        if current and (used + cost > EVAL_BATCH_PROMPT_BUDGET or len(current) >= EVAL_BATCH_MAX_ITEMS):
+            chunks.append(current)
+            current = []
+            used = 0
+        current.append(item)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def grade_eval_chunk(chunk):
+    lines = "\n".join(item["line"] for item in chunk)
+    prompt = f"""Evaluate semantic similarity between the ideal answer and the user answer for each question below.
+Accept paraphrases and different wording if meaning matches.
+Return only JSON of the form {{"results": [{{"id": <id>, "score": <0 to 1>, "feedback": "<short>"}}]}}
+with one entry per item.
+
+Items (one JSON object per line):
+{lines}
+"""
+    messages = [
+        {"role": "system", "content": "Return only valid JSON. No extra text."},
+        {"role": "user", "content": prompt},
+    ]
+    content = GROK.chat(
+        "evaluate_batch", messages, max_tokens=60 * len(chunk) + 50, timeout=25, validate=has_json_object
+    )
+    parsed = parse_json_object(content)
+    GROK.record_outcome("evaluate_batch", parsed=parsed is not None)
+    parsed = parsed or {}
+    graded = {}
+    for entry in parsed.get("results") or []:
+        if isinstance(entry, dict) and entry.get("id") is not None:
+            graded[str(entry.get("id"))] = parse_eval_result(entry)
+    return graded
+
+
+@app.route("/api/ai/evaluate/batch", methods=["POST"])
+def ai_evaluate_batch():
+    payload = request.get_json(silent=True) or {}
+    items = payload.get("items") or []
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "missing_items"}), 400
+    default_threshold = parse_eval_threshold(payload.get("threshold"))
+
+    results = [None] * len(items)
+    pending = []
+    for i, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        question = item.get("question") or ""
+        ideal_answer = item.get("idealAnswer") or item.get("ideal_answer") or ""
+        user_answer = item.get("userAnswer") or item.get("user_answer") or ""
+        threshold = default_threshold
+        if item.get("threshold") is not None:
+            threshold = parse_eval_threshold(item.get("threshold"))
+        if not ideal_answer or not user_answer:
+            results[i] = {"error": "missing_fields"}
+            continue
+
+        local_result = score_answer_locally(ideal_answer, user_answer, threshold)
+        if local_result:
+            results[i] = local_result
+            continue
+
+        key = grade_cache_key(question, ideal_answer, user_answer)
+        cached, tier = GROK.cache.get(key) if GROK.cache is not None else (None, None)
+        if tier:
+            score, feedback = parse_eval_result(json.loads(cached))
+            results[i] = {"correct": score >= threshold, "score": score, "feedback": feedback, "source": "cache"}
+            continue
+
+        pending.append(
+            {
+                "index": i,
+                "key": key,
+                "threshold": threshold,
+                "line": format_eval_item(i, question, ideal_answer, user_answer),
+            }
+        )
+
+    if pending and not GROK_API_KEY:
+        for item in pending:
+            results[item["index"]] = {"error": "grok_not_configured"}
+        pending = []
+
+    chunks = pack_eval_items(pending)
+    futures = [(chunk, AI_EXECUTOR.submit(grade_eval_chunk, chunk)) for chunk in chunks]
+    with METRICS.time("stage_duration_seconds", stage="ai"):
+        wait([future for _, future in futures])
+    for chunk, future in futures:
+        try:
+            graded = future.result()
+        except Exception as exc:
+            GROK.record_outcome("evaluate_batch", fallback=failure_reason(exc))
+            graded = {}
+            error = str(exc)
+        else:
+            error = "missing_from_model_response"
+        for item in chunk:
+            result = graded.get(str(item["index"]))
+            if result is None:
+                results[item["index"]] = {"error": error}
+                continue
+            score, feedback = result
+            if GROK.cache is not None:
+                GROK.cache.put(item["key"], json.dumps({"score": score, "feedback": feedback}))
+            results[item["index"]] = {
+                "correct": score >= item["threshold"],
+                "score": score,
+                "feedback": feedback,
+                "source": "grok",
+            }
+
+    return jsonify({"results": results, "model_calls": len(chunks)})
 
 
 @app.route("/api/ai/evaluate", methods=["POST"])
 def ai_evaluate():
-    if not GROK_API_KEY:
-        return jsonify({"error": "grok_not_configured"}), 503
-
     payload = request.get_json(silent=True) or {}
     question = payload.get("question") or ""
     ideal_answer = payload.get("idealAnswer") or payload.get("ideal_answer") or ""
@@ -1265,12 +2553,15 @@ def ai_evaluate():
     if not ideal_answer or not user_answer:
         return jsonify({"error": "missing_fields"}), 400
 
-    score_threshold = GROK_THRESHOLD
-    try:
-        if threshold is not None:
-            score_threshold = float(threshold)
-    except Exception:
-        score_threshold = GROK_THRESHOLD
+    score_threshold = parse_eval_threshold(threshold)
+
+    # Clear matches and clear misses are graded locally; only the ambiguous band reaches Grok.
+    local_result = score_answer_locally(ideal_answer, user_answer, score_threshold)
+    if local_result:
+        return jsonify(local_result)
+
+    if not GROK_API_KEY:
+        return jsonify({"error": "grok_not_configured"}), 503
 
     prompt = f"""Evaluate semantic similarity between the ideal answer and the user answer for the question.
 Return only JSON with fields: score (0 to 1) and feedback (short).
@@ -1281,48 +2572,27 @@ Ideal answer: {ideal_answer}
 User answer: {user_answer}
 """
 
-    grok_payload = {
-        "model": GROK_MODEL,
-        "messages": [
-            {"role": "system", "content": "Return only valid JSON. No extra text."},
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": 0.2,
-        "max_tokens": 200,
-    }
+    messages = [
+        {"role": "system", "content": "Return only valid JSON. No extra text."},
+        {"role": "user", "content": prompt},
+    ]
 
     try:
-        response = requests.post(
-            build_grok_url(),
-            headers={"Authorization": f"Bearer {GROK_API_KEY}"},
-            json=grok_payload,
-            timeout=20,
-        )
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        parsed = parse_json_object(content) or {}
-        score_raw = parsed.get("score")
-        try:
-            score = float(score_raw)
-        except Exception:
-            score = 0.0
-        score = max(0.0, min(1.0, score))
-        feedback = parsed.get("feedback") if isinstance(parsed.get("feedback"), str) else "Answer evaluated."
+        with METRICS.time("stage_duration_seconds", stage="ai"):
+            content = GROK.chat("evaluate", messages, max_tokens=200, timeout=20, validate=has_json_object)
+        parsed = parse_json_object(content)
+        GROK.record_outcome("evaluate", parsed=parsed is not None)
+        score, feedback = parse_eval_result(parsed or {})
         correct = score >= score_threshold
-        return jsonify({"correct": correct, "score": score, "feedback": feedback})
+        return jsonify({"correct": correct, "score": score, "feedback": feedback, "source": "grok"})
     except Exception as exc:
+        GROK.record_outcome("evaluate", fallback=failure_reason(exc))
         return jsonify({"error": str(exc)}), 400
 
 
-@app.route("/api/employee-feedback", methods=["POST"])
-def employee_feedback():
-    if not GROK_API_KEY:
-        return jsonify({"error": "Missing GROK_API_KEY"}), 400
-
-    payload = request.get_json(silent=True) or {}
-    employee = payload.get("employee") or payload.get("user") or payload.get("chatter")
-    if not employee:
-        return jsonify({"error": "Missing employee"}), 400
+def build_employee_feedback_messages(employee):
+    projected = project_employee(employee)
+    employee_json = compact_prompt("employee_feedback", employee, projected, employee_samples(projected))
 
     prompt = f"""You are a performance coach for an OnlyFans chatter team.
 Given the employee stats below, produce coaching feedback.
@@ -1332,40 +2602,102 @@ Return ONLY valid JSON with keys:
 - next_steps: string[] (max 5)
 
 Employee stats JSON:
-{json.dumps(employee, ensure_ascii=False)}
+{employee_json}
 """
 
-    grok_payload = {
-        "model": GROK_MODEL,
-        "messages": [
-            {"role": "system", "content": "Return only valid JSON. No extra text."},
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": 0.2,
-        "max_tokens": 350,
-    }
+    return [
+        {"role": "system", "content": "Return only valid JSON. No extra text."},
+        {"role": "user", "content": prompt},
+    ]
 
-    try:
-        response = requests.post(
-            build_grok_url(),
-            headers={"Authorization": f"Bearer {GROK_API_KEY}"},
-            json=grok_payload,
-            timeout=25,
+
+def parse_employee_feedback(content):
+    parsed = parse_json_object(content) or {}
+    strengths = parsed.get("strengths") if isinstance(parsed.get("strengths"), list) else []
+    improvements = parsed.get("improvements") if isinstance(parsed.get("improvements"), list) else []
+    next_steps = parsed.get("next_steps") if isinstance(parsed.get("next_steps"), list) else []
+    return {"strengths": strengths, "improvements": improvements, "next_steps": next_steps}
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def wants_stream(payload):
+    flag = request.args.get("stream") or payload.get("stream")
+    return str(flag).lower() in ("1", "true", "yes")
+
+
+def stream_feedback_response(endpoint, messages, keys, parse, fallback=None, validate=has_json_object):
+    # Forwards each completed list item as an "item" event while the model is
+    # still generating, then the fully parsed object as a "result" event.
+    # parse may raise ValueError on an unusable reply; validate decides what
+    # gets cached and should accept only replies parse can read.
+    def generate():
+        parser = StreamingListParser(keys)
+        try:
+            for delta in GROK.stream(endpoint, messages, max_tokens=350, timeout=25, validate=validate):
+                for key, value in parser.feed(delta):
+                    yield format_sse("item", {"key": key, "value": value})
+            try:
+                result = parse(parser.text)
+            except (TypeError, ValueError):
+                GROK.record_outcome(endpoint, parsed=False)
+                raise
+            GROK.record_outcome(endpoint, parsed=parse_json_object(parser.text) is not None)
+            yield format_sse("result", result)
+        except Exception as exc:
+            GROK.record_outcome(endpoint, fallback=failure_reason(exc))
+            if fallback is None:
+                yield format_sse("error", {"error": str(exc)})
+            else:
+                yield format_sse("result", fallback())
+        yield format_sse("done", {})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/employee-feedback", methods=["POST"])
+def employee_feedback():
+    if not GROK_API_KEY:
+        return jsonify({"error": "Missing GROK_API_KEY"}), 400
+
+    payload = resolve_analysis_payload(request.get_json(silent=True) or {}, ("employee", "user", "chatter"))
+    employee = payload.get("employee") or payload.get("user") or payload.get("chatter")
+    if not employee:
+        return jsonify({"error": "Missing employee"}), 400
+    if not isinstance(employee, dict):
+        return jsonify({"error": "Invalid employee"}), 400
+
+    messages = build_employee_feedback_messages(employee)
+    if wants_stream(payload):
+        return stream_feedback_response(
+            "employee_feedback",
+            messages,
+            ("strengths", "improvements", "next_steps"),
+            parse_employee_feedback,
         )
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        parsed = parse_json_object(content) or {}
-        strengths = parsed.get("strengths") if isinstance(parsed.get("strengths"), list) else []
-        improvements = parsed.get("improvements") if isinstance(parsed.get("improvements"), list) else []
-        next_steps = parsed.get("next_steps") if isinstance(parsed.get("next_steps"), list) else []
-        return jsonify({"strengths": strengths, "improvements": improvements, "next_steps": next_steps})
+
+    try:
+        with METRICS.time("stage_duration_seconds", stage="ai"):
+            content, cache_status = GROK.complete(
+                "employee_feedback", messages, max_tokens=350, timeout=25, validate=has_json_object
+            )
     except Exception as exc:
+        GROK.record_outcome("employee_feedback", fallback=failure_reason(exc))
         return jsonify({"error": str(exc)}), 400
+    GROK.record_outcome("employee_feedback", parsed=parse_json_object(content) is not None)
+    feedback = parse_employee_feedback(content)
+    feedback["cache"] = cache_status
+    return jsonify(feedback)
 
 
-@app.route("/api/chat-feedback", methods=["POST"])
-def chat_feedback():
-    payload = request.get_json(silent=True) or {}
+@METRICS.timed("stage_duration_seconds", stage="ai")
+def chat_feedback_job(payload):
     employee = payload.get("employee") or payload.get("chatter")
     top_peers = payload.get("top_peers") or []
     ai_enabled = payload.get("ai_enabled")
@@ -1373,30 +2705,315 @@ def chat_feedback():
         ai_enabled = True
 
     if not employee:
-        return jsonify({"error": "Missing employee"}), 400
+        raise ValueError("Missing employee")
+    if not isinstance(employee, dict):
+        raise ValueError("Invalid employee")
 
     feedback = build_ai_chat_feedback(employee, top_peers, ai_enabled)
     if not feedback:
-        return jsonify({"error": "Missing chat data for employee"}), 400
+        raise ValueError("Missing chat data for employee")
+    return feedback
 
-    return jsonify(feedback)
 
+@METRICS.timed("stage_duration_seconds", stage="ai")
+def compare_job(payload):
+    user_a = payload.get("user_a")
+    user_b = payload.get("user_b")
+    ai_enabled = bool(payload.get("ai_enabled"))
+    if not user_a or not user_b:
+        raise ValueError("Missing users")
+    return {"summary": build_ai_pair_summary(user_a, user_b, ai_enabled)}
 
-@app.route("/api/compare", methods=["POST"])
-def compare_users():
+
+@METRICS.timed("stage_duration_seconds", stage="ai")
+def insights_job(payload):
+    employee = payload.get("employee") or payload.get("user")
+    ai_enabled = payload.get("ai_enabled")
+    if ai_enabled is None:
+        ai_enabled = True
+    if not employee:
+        raise ValueError("Missing employee")
+    missing = [key for key in PROMPT_STAT_FIELDS if key not in employee]
+    if missing:
+        raise ValueError(f"Missing stats: {', '.join(missing)}")
+    return {
+        "insights": build_ai_insights(employee, ai_enabled),
+        "chat_ai": build_ai_chatter_summary(employee, ai_enabled),
+    }
+
+
+JOB_RUNNERS = {
+    "chat_feedback": chat_feedback_job,
+    "compare": compare_job,
+    "insights": insights_job,
+}
+
+# Payload fields that may name an employee of a stored analysis.
+JOB_EMPLOYEE_KEYS = {
+    "chat_feedback": ("employee", "chatter", "top_peers"),
+    "compare": ("user_a", "user_b"),
+    "insights": ("employee", "user"),
+}
+
+
+def default_top_peers(employees, employee):
+    peers = [e for e in employees if e.get("chat") and e.get("employee") != employee.get("employee")]
+    return heapq.nlargest(ANALYSIS_TOP_PEERS, peers, key=lambda e: e.get("sales") or 0)
+
+
+def resolve_analysis_payload(payload, keys):
+    # Follow-up calls may send analysis_id plus employee names instead of full
+    # employee objects; swap the names for the objects stored by /api/analyze.
+    analysis_id = payload.get("analysis_id")
+    if not analysis_id:
+        return payload
+    employees = ANALYSES.get(analysis_id)["employees"]
+    by_name = {emp["employee"]: emp for emp in employees}
+
+    def lookup(name):
+        if name not in by_name:
+            raise AnalysisNotFound(f"Unknown employee: {name}")
+        return by_name[name]
+
+    resolved = {k: v for k, v in payload.items() if k != "analysis_id"}
+    subject = None
+    for key in keys:
+        if key == "top_peers":
+            continue
+        if isinstance(payload.get(key), str):
+            resolved[key] = lookup(payload[key])
+        if subject is None and isinstance(resolved.get(key), dict):
+            subject = resolved[key]
+    if "top_peers" in keys:
+        # Without an explicit list, coach against the analysis' top chatters.
+        if "top_peers" in payload:
+            resolved["top_peers"] = [lookup(p) if isinstance(p, str) else p for p in payload["top_peers"] or []]
+        elif subject is not None:
+            resolved["top_peers"] = default_top_peers(employees, subject)
+    return resolved
+
+
+@app.errorhandler(AnalysisNotFound)
+def analysis_not_found(exc):
+    return jsonify({"error": str(exc)}), 404
+
+
+def job_links(job):
+    base = f"/api/jobs/{job['id']}"
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": base,
+        "events_url": f"{base}/events",
+        "cancel_url": f"{base}/cancel",
+    }
+
+
+def wants_async(payload):
+    flag = request.args.get("async") or payload.get("async")
+    return str(flag).lower() in ("1", "true", "yes")
+
+
+def run_ai_request(kind, payload):
+    payload = resolve_analysis_payload(payload, JOB_EMPLOYEE_KEYS[kind])
+    if wants_async(payload):
+        job = JOBS.submit(kind, JOB_RUNNERS[kind], payload)
+        return jsonify(job_links(job)), 202
     try:
-        payload = request.get_json(silent=True) or {}
-        user_a = payload.get("user_a")
-        user_b = payload.get("user_b")
-        ai_enabled = bool(payload.get("ai_enabled"))
-        if not user_a or not user_b:
-            return jsonify({"error": "Missing users"}), 400
-        summary = build_ai_pair_summary(user_a, user_b, ai_enabled)
-        return jsonify({"summary": summary})
+        return jsonify(JOB_RUNNERS[kind](payload))
     except Exception as exc:
         return jsonify({"error": str(exc)}), 400
 
 
+@app.route("/api/jobs", methods=["POST"])
+def create_job():
+    payload = request.get_json(silent=True) or {}
+    kind = payload.get("kind")
+    if kind not in JOB_RUNNERS:
+        return jsonify({"error": f"Unknown job kind: {kind}"}), 400
+    payload = resolve_analysis_payload(payload, JOB_EMPLOYEE_KEYS[kind])
+    job = JOBS.submit(kind, JOB_RUNNERS[kind], payload)
+    return jsonify(job_links(job)), 202
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = JOBS.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    job = JOBS.cancel(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+
+@app.route("/api/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    # SSE: "progress" whenever the job record changes, then one final event
+    # named after its status (done/failed/cancelled) carrying the whole job.
+    if not JOBS.get(job_id):
+        return jsonify({"error": "Unknown job"}), 404
+
+    def generate():
+        seen = None
+        while True:
+            job = JOBS.get(job_id)
+            if job is None:
+                yield format_sse("failed", {"id": job_id, "status": "failed", "error": "Unknown job"})
+                return
+            if job["status"] in FINAL_STATUSES:
+                yield format_sse(job["status"], job)
+                return
+            if job["updated_at"] != seen:
+                seen = job["updated_at"]
+                summary = {key: job.get(key) for key in ("id", "kind", "status", "progress", "cancel_requested")}
+                yield format_sse("progress", summary)
+            time.sleep(JOB_EVENTS_INTERVAL)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/chat-feedback", methods=["POST"])
+def chat_feedback():
+    payload = resolve_analysis_payload(request.get_json(silent=True) or {}, JOB_EMPLOYEE_KEYS["chat_feedback"])
+    employee = payload.get("employee") or payload.get("chatter")
+    ai_enabled = payload.get("ai_enabled") is not False
+    if employee and not isinstance(employee, dict):
+        return jsonify({"error": "Invalid employee"}), 400
+    if employee and employee.get("chat") and ai_enabled and GROK_API_KEY and wants_stream(payload):
+        messages = extract_chat_messages(employee["chat"])
+        tos_flags = detect_tos_flags(messages)
+        return stream_feedback_response(
+            "chat_feedback",
+            build_chat_feedback_messages(employee, payload.get("top_peers") or [], tos_flags, messages),
+            ("strengths", "improvements"),
+            lambda content: parse_chat_feedback(content, tos_flags),
+            lambda: build_fallback_chat_feedback(employee, tos_flags),
+            validate=is_chat_feedback,
+        )
+    return run_ai_request("chat_feedback", payload)
+
+
+@app.route("/api/chat-feedback/batch", methods=["POST"])
+def chat_feedback_batch():
+    payload = request.get_json(silent=True) or {}
+    employees = payload.get("employees") or payload.get("chatters") or []
+    top_peers = payload.get("top_peers") or []
+    ai_enabled = payload.get("ai_enabled")
+    if ai_enabled is None:
+        ai_enabled = True
+
+    if not isinstance(employees, list) or not employees:
+        return jsonify({"error": "Missing employees"}), 400
+
+    deadline = AI_BATCH_DEADLINE
+    try:
+        if payload.get("deadline") is not None:
+            deadline = max(0.0, min(AI_BATCH_DEADLINE, float(payload.get("deadline"))))
+    except (TypeError, ValueError):
+        deadline = AI_BATCH_DEADLINE
+
+    futures = {}
+    for i, emp in enumerate(employees):
+        if isinstance(emp, dict) and emp.get("chat"):
+            futures[i] = AI_EXECUTOR.submit(build_ai_chat_feedback, emp, top_peers, ai_enabled)
+    with METRICS.time("stage_duration_seconds", stage="ai"):
+        wait(list(futures.values()), timeout=deadline)
+
+    results = []
+    timed_out = 0
+    failed = 0
+    for i, emp in enumerate(employees):
+        name = (emp.get("employee") or emp.get("name")) if isinstance(emp, dict) else None
+        future = futures.get(i)
+        if future is None:
+            results.append({"employee": name, "error": "Missing chat data for employee"})
+            continue
+        if future.done() and not future.exception():
+            results.append({"employee": name, "feedback": future.result(), "timed_out": False})
+            continue
+        # Missed the deadline or raised: answer from local metrics instead,
+        # and say which (fallback_reason is a failure_reason label).
+        if future.done():
+            failed += 1
+            reason = failure_reason(future.exception())
+        else:
+            future.cancel()
+            timed_out += 1
+            reason = "deadline"
+        GROK.record_outcome("chat_feedback", fallback=reason)
+        tos_flags = detect_tos_flags(extract_chat_messages(emp.get("chat")))
+        results.append(
+            {
+                "employee": name,
+                "feedback": build_fallback_chat_feedback(emp, tos_flags),
+                "timed_out": reason == "deadline",
+                "fallback_reason": reason,
+            }
+        )
+
+    return jsonify({"results": results, "timed_out": timed_out, "failed": failed, "deadline": deadline})
+
+
+@app.route("/api/ai/stream", methods=["POST"])
+def ai_stream():
+    payload = request.get_json(silent=True) or {}
+    employees = payload.get("employees") or payload.get("chatters") or []
+    top_peers = payload.get("top_peers") or []
+    ai_enabled = payload.get("ai_enabled")
+    if ai_enabled is None:
+        ai_enabled = True
+
+    if not isinstance(employees, list) or not employees:
+        return jsonify({"error": "Missing employees"}), 400
+
+    tasks = []
+    for emp in employees:
+        if not isinstance(emp, dict):
+            continue
+        name = emp.get("employee") or emp.get("name")
+        tasks.append((name, "insights", build_ai_insights, (emp, ai_enabled)))
+        if emp.get("chat"):
+            tasks.append((name, "chat_feedback", build_ai_chat_feedback, (emp, top_peers, ai_enabled)))
+            tasks.append((name, "chat_ai", build_ai_chatter_summary, (emp, ai_enabled)))
+
+    def generate():
+        futures = {AI_EXECUTOR.submit(fn, *args): (name, kind) for name, kind, fn, args in tasks}
+        try:
+            yield format_sse("start", {"total": len(futures)})
+            # Emit each result as soon as it lands so the fastest call is shown first.
+            for future in as_completed(futures):
+                name, kind = futures[future]
+                try:
+                    yield format_sse("result", {"employee": name, "kind": kind, "data": future.result()})
+                except Exception as exc:
+                    yield format_sse("error", {"employee": name, "kind": kind, "error": str(exc)})
+            yield format_sse("done", {"total": len(futures)})
+        finally:
+            for future in futures:
+                future.cancel()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/compare", methods=["POST"])
+def compare_users():
+    return run_ai_request("compare", request.get_json(silent=True) or {})
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "5000"))
     debug = os.getenv("FLASK_DEBUG", "").lower() in ("1", "true", "yes")
@@ -0,0 +1,493 @@
+import bisect
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ai_cache import build_cache_key
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Upper bounds (ms) of the per-endpoint latency histogram; the last bucket is +Inf.
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class GrokError(Exception):
+    pass
+
+
+class CircuitOpenError(GrokError):
+    pass
+
+
+def failure_reason(exc):
+    # Short label for why an AI call produced no usable result.
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    message = str(exc).lower()
+    if isinstance(exc, requests.Timeout) or "timeout" in message or "timed out" in message:
+        return "timeout"
+    if isinstance(exc, ValueError):
+        return "parse_error"
+    return "error"
+
+
+def parses_as_json(content):
+    # Default cache check: the reply, or the outermost {...} or [...] in it,
+    # is valid JSON. Truncated and free-text replies are not cached.
+    text = content or ""
+    for opener, closer in (("{", "}"), ("[", "]")):
+        start = text.find(opener)
+        end = text.rfind(closer)
+        if start == -1 or end <= start:
+            continue
+        try:
+            json.loads(text[start : end + 1])
+        except ValueError:
+            continue
+        return True
+    return False
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.content = None
+        self.error = None
+
+
+class CircuitBreaker:
+    # Calls that error (timeouts included) count as failures. Latency alone
+    # only counts when slow_seconds is set: successful calls longer than that
+    # are then failures too (tallied in slow_calls). The default None never
+    # trips on latency. When the failure rate over the last `window` calls
+    # reaches error_rate the breaker opens; after `cooldown` seconds one probe
+    # is let through.
+    def __init__(self, window=20, min_calls=5, error_rate=0.5, slow_seconds=None, cooldown=30.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.slow_calls = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, ok, latency):
+        slow = ok and self.slow_seconds is not None and latency > self.slow_seconds
+        failed = not ok or slow
+        with self._lock:
+            if slow:
+                self.slow_calls += 1
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls:
+                rate = sum(self._outcomes) / len(self._outcomes)
+                if rate >= self.error_rate:
+                    self._open()
+
+    def release(self):
+        # For calls abandoned by the caller: frees a half-open probe slot
+        # without recording an outcome.
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def is_open(self):
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self._opened_at < self.cooldown
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == "open":
+                retry_in = max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+            return {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": sum(self._outcomes),
+                "slow_calls": self.slow_calls,
+                "retry_in": retry_in,
+            }
+
+
+class GrokClient:
+    def __init__(
+        self,
+        url,
+        api_key,
+        model,
+        pool_size=10,
+        max_retries=2,
+        backoff=0.5,
+        cache=None,
+        breaker=None,
+        prompt_price=0.0,
+        completion_price=0.0,
+        metrics_log=None,
+    ):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.breaker = breaker or CircuitBreaker()
+        # USD per million tokens, used for the cost estimate in stats().
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        # Optional JSON-lines file receiving one record per call and per outcome.
+        self.metrics_log = metrics_log
+        self._log_lock = threading.Lock()
+
+        # One keep-alive pool shared by every AI call site.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._flights = {}
+
+    def _entry(self, endpoint):
+        return self._stats.setdefault(
+            endpoint,
+            {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "rejected": 0,
+                "coalesced": 0,
+                "cancelled": 0,
+                "latency_ms_total": 0.0,
+                "latency_ms_max": 0.0,
+                "latency_buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "parsed": 0,
+                "parse_failures": 0,
+                "fallbacks": {},
+                "last_error": None,
+            },
+        )
+
+    def _log(self, record):
+        if not self.metrics_log:
+            return
+        record = dict(record, ts=round(time.time(), 3), model=self.model)
+        line = json.dumps(record, separators=(",", ":"))
+        with self._log_lock:
+            try:
+                with open(self.metrics_log, "a", encoding="utf-8") as fh:
+                    fh.write(line + "\n")
+            except OSError:
+                pass
+
+    def _count(self, endpoint, counter):
+        with self._lock:
+            self._entry(endpoint)[counter] += 1
+
+    def _record(self, endpoint, latency, error=None, usage=None):
+        usage = usage or {}
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        latency_ms = latency * 1000.0
+        with self._lock:
+            entry = self._entry(endpoint)
+            entry["calls"] += 1
+            entry["latency_ms_total"] += latency_ms
+            entry["latency_ms_max"] = max(entry["latency_ms_max"], latency_ms)
+            entry["latency_buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            if error is not None:
+                entry["errors"] += 1
+                entry["last_error"] = error
+        self._log(
+            {
+                "event": "call",
+                "endpoint": endpoint,
+                "latency_ms": round(latency_ms, 1),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "error": error,
+            }
+        )
+
+    def record_outcome(self, endpoint, parsed=None, fallback=None):
+        # Called by the endpoint once it knows whether the reply was usable.
+        # parsed is None when no reply was parsed; fallback names why the
+        # caller answered without AI output (see failure_reason).
+        with self._lock:
+            entry = self._entry(endpoint)
+            if parsed is True:
+                entry["parsed"] += 1
+            elif parsed is False:
+                entry["parse_failures"] += 1
+            if fallback:
+                entry["fallbacks"][fallback] = entry["fallbacks"].get(fallback, 0) + 1
+        self._log({"event": "outcome", "endpoint": endpoint, "parsed": parsed, "fallback": fallback})
+
+    def coalesced_total(self):
+        with self._lock:
+            return sum(entry["coalesced"] for entry in self._stats.values())
+
+    def stats(self):
+        with self._lock:
+            snapshot = {}
+            for endpoint, entry in self._stats.items():
+                item = dict(entry)
+                item["fallbacks"] = dict(entry["fallbacks"])
+                item["latency_ms_avg"] = entry["latency_ms_total"] / entry["calls"] if entry["calls"] else None
+                # Cumulative counts, keyed by bucket upper bound in ms.
+                histogram = {}
+                running = 0
+                buckets = item.pop("latency_buckets")
+                for bound, count in zip(LATENCY_BUCKETS_MS + ("+Inf",), buckets):
+                    running += count
+                    histogram[str(bound)] = running
+                item["latency_histogram_ms"] = histogram
+                item["cost_usd"] = round(
+                    (entry["prompt_tokens"] * self.prompt_price + entry["completion_tokens"] * self.completion_price)
+                    / 1_000_000,
+                    6,
+                )
+                snapshot[endpoint] = item
+            return snapshot
+
+    def _sleep_before_retry(self, attempt, deadline, retry_after=None):
+        delay = self.backoff * (2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay >= deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def build_payload(self, messages, max_tokens, temperature=0.2):
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+    def chat(self, endpoint, messages, max_tokens, timeout, temperature=0.2, use_cache=True, validate=parses_as_json):
+        content, _ = self.complete(endpoint, messages, max_tokens, timeout, temperature, use_cache, validate)
+        return content
+
+    def complete(
+        self, endpoint, messages, max_tokens, timeout, temperature=0.2, use_cache=True, validate=parses_as_json
+    ):
+        # Returns (content, cache_status); cache_status is "memory", "disk",
+        # "miss", "coalesced" or "off". use_cache=False skips both the cache
+        # and request coalescing. Only replies for which validate(content) is
+        # true are cached, so an unparseable reply is retried next time.
+        if not use_cache:
+            return self._post(endpoint, messages, max_tokens, timeout, temperature), "off"
+
+        key = build_cache_key(self.model, messages, temperature, max_tokens)
+        cache_enabled = self.cache is not None and self.cache.enabled
+        if cache_enabled:
+            content, tier = self.cache.get(key)
+            if tier:
+                return content, tier
+
+        # Single flight: identical prompts already in flight share one upstream call.
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self._count(endpoint, "coalesced")
+            if not flight.done.wait(timeout):
+                raise GrokError("Timed out waiting for an identical in-flight Grok call")
+            if flight.error is not None:
+                raise flight.error
+            return flight.content, "coalesced"
+
+        try:
+            content = self._post(endpoint, messages, max_tokens, timeout, temperature)
+            if cache_enabled and validate(content):
+                self.cache.put(key, content)
+            flight.content = content
+            return content, "miss" if cache_enabled else "off"
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stream(
+        self, endpoint, messages, max_tokens, timeout, temperature=0.2, use_cache=True, validate=parses_as_json
+    ):
+        # Yields content deltas from a streamed completion. A cache hit yields
+        # the whole cached content as a single chunk; a finished stream is
+        # cached like complete(). No retries: once tokens have been forwarded
+        # the call cannot be replayed transparently.
+        key = None
+        if use_cache and self.cache is not None and self.cache.enabled:
+            key = build_cache_key(self.model, messages, temperature, max_tokens)
+            content, tier = self.cache.get(key)
+            if tier:
+                yield content
+                return
+
+        if not self.breaker.allow():
+            self._count(endpoint, "rejected")
+            raise CircuitOpenError("Grok circuit breaker is open")
+
+        payload = self.build_payload(messages, max_tokens, temperature)
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        started = time.monotonic()
+        parts = []
+        usage = None
+        error = None
+        closed_by_caller = False
+        try:
+            with self.session.post(
+                self.url, headers=headers, json=payload, timeout=timeout, stream=True
+            ) as response:
+                response.raise_for_status()
+                response.encoding = "utf-8"
+                for line in response.iter_lines(decode_unicode=True):
+                    if time.monotonic() - started > timeout:
+                        raise GrokError("Grok stream exceeded its timeout")
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:") :].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    failure = chunk.get("error")
+                    if failure:
+                        # Failures after the 200 arrive in-band as an error event.
+                        message = failure.get("message") if isinstance(failure, dict) else failure
+                        raise GrokError(f"Grok stream failed: {message}")
+                    # With include_usage the final chunk carries usage and no choices.
+                    usage = chunk.get("usage") or usage
+                    choices = chunk.get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+                else:
+                    raise GrokError("Grok stream ended before [DONE]")
+        except GeneratorExit:
+            # The consumer went away (e.g. the browser closed the SSE stream);
+            # that says nothing about Grok's health.
+            closed_by_caller = True
+            raise
+        except Exception as exc:
+            error = str(exc)
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            if closed_by_caller:
+                self._count(endpoint, "cancelled")
+                self.breaker.release()
+            else:
+                self._record(endpoint, elapsed, error=error, usage=usage)
+                self.breaker.record(error is None, elapsed)
+
+        content = "".join(parts)
+        if key and validate(content):
+            self.cache.put(key, content)
+
+    def _post(self, endpoint, messages, max_tokens, timeout, temperature):
+        # Fail fast while the breaker is open so callers fall back immediately.
+        if not self.breaker.allow():
+            self._count(endpoint, "rejected")
+            raise CircuitOpenError("Grok circuit breaker is open")
+        started = time.monotonic()
+        try:
+            content = self._post_with_retries(endpoint, messages, max_tokens, timeout, temperature)
+        except Exception:
+            self.breaker.record(False, time.monotonic() - started)
+            raise
+        self.breaker.record(True, time.monotonic() - started)
+        return content
+
+    def _post_with_retries(self, endpoint, messages, max_tokens, timeout, temperature):
+        # timeout bounds the whole call, retries included.
+        payload = self.build_payload(messages, max_tokens, temperature)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        started = time.monotonic()
+        deadline = started + timeout
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._record(endpoint, time.monotonic() - started, error="deadline exceeded")
+                raise GrokError("Grok call exceeded its timeout")
+            try:
+                response = self.session.post(self.url, headers=headers, json=payload, timeout=remaining)
+            except requests.RequestException as exc:
+                if attempt < self.max_retries and self._sleep_before_retry(attempt, deadline):
+                    self._count(endpoint, "retries")
+                    attempt += 1
+                    continue
+                self._record(endpoint, time.monotonic() - started, error=str(exc))
+                raise
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                retry_after = None
+                try:
+                    retry_after = float(response.headers.get("Retry-After"))
+                except (TypeError, ValueError):
+                    pass
+                if self._sleep_before_retry(attempt, deadline, retry_after):
+                    self._count(endpoint, "retries")
+                    attempt += 1
+                    continue
+
+            try:
+                response.raise_for_status()
+                data = response.json()
+                content = data["choices"][0]["message"]["content"]
+            except Exception as exc:
+                self._record(endpoint, time.monotonic() - started, error=str(exc))
+                raise
+
+            self._record(endpoint, time.monotonic() - started, usage=data.get("usage"))
+            return content
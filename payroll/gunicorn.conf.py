@@ -0,0 +1,28 @@
+# Multi-worker serving for the payroll API:
+#
+#   cd payroll && gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Reads the same environment as app.py (PORT, CORS_ORIGINS, GROK_*, ...).
+# WEB_CONCURRENCY sets the number of worker processes and GUNICORN_THREADS the
+# threads per worker (AI calls spend most of their time waiting on Grok).
+import multiprocessing
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Workers are separate processes, so analyses and parsed uploads go through a
+# shared SQLite file instead of per-process memory.
+os.environ.setdefault("SHARED_STORE_PATH", os.path.join(BASE_DIR, "shared_store.sqlite3"))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+# Large workbooks take a while to parse; keep this above the slowest upload.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to cap memory growth from openpyxl.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "500"))
+max_requests_jitter = 50
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
@@ -0,0 +1,247 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+FINAL_STATUSES = ("done", "failed", "cancelled")
+# How often a running job looks for a cancel marker left by another process.
+CANCEL_POLL_SECONDS = 0.5
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__("server_busy")
+        self.retry_after = retry_after
+
+
+class JobControl:
+    # Handed to tracked jobs: report() publishes progress on the job record and
+    # check() raises JobCancelled once a cancel was requested, from this
+    # process (event) or another worker sharing the directory (marker file).
+    def __init__(self, queue, job_id):
+        self._queue = queue
+        self.job_id = job_id
+        self._next_poll = 0.0
+
+    def report(self, **progress):
+        self._queue._update(self.job_id, progress=progress)
+
+    def check(self):
+        if self._queue._cancel_requested(self.job_id):
+            raise JobCancelled()
+        now = time.monotonic()
+        if now >= self._next_poll:
+            self._next_poll = now + CANCEL_POLL_SECONDS
+            if os.path.exists(self._queue._cancel_path(self.job_id)):
+                raise JobCancelled()
+
+
+class JobQueue:
+    # Jobs run on a local thread pool and every state change is written to
+    # <directory>/<job_id>.json, so results survive page refreshes and restarts.
+    # Jobs go to the "default" lane unless submitted to one added with add_lane().
+    def __init__(self, directory, workers=4, ttl=86400):
+        self.directory = directory
+        self.ttl = ttl
+        self._lanes = {}
+        self.add_lane("default", workers)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._cancelled = set()
+        os.makedirs(self.directory, exist_ok=True)
+        self._recover()
+
+    def add_lane(self, name, workers, max_jobs=None, max_bytes=None):
+        # A lane has its own pool, so its jobs never wait behind other lanes.
+        # max_jobs/max_bytes bound the queued plus running jobs (and the cost
+        # their payloads declare at submit); beyond them submit() raises
+        # JobQueueFull instead of holding more payloads in memory.
+        self._lanes[name] = {
+            "executor": ThreadPoolExecutor(max_workers=workers),
+            "workers": workers,
+            "max_jobs": max_jobs,
+            "max_bytes": max_bytes,
+            "jobs": 0,
+            "bytes": 0,
+            "avg_seconds": 1.0,
+        }
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _cancel_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.cancel")
+
+    def _cancel_requested(self, job_id):
+        with self._lock:
+            return job_id in self._cancelled
+
+    def _write(self, job):
+        path = self._path(job["id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(job, fh)
+        os.replace(tmp_path, path)
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _owner_alive(pid):
+        if not pid or pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            return True
+        return True
+
+    def _recover(self):
+        # Work that was queued or running when its process stopped is lost.
+        # Jobs owned by other live worker processes sharing the directory are
+        # left alone.
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            job = self._read(name[: -len(".json")])
+            if job and job.get("status") not in FINAL_STATUSES and not self._owner_alive(job.get("pid")):
+                job["status"] = "failed"
+                job["error"] = "Interrupted by server restart"
+                job["updated_at"] = time.time()
+                self._write(job)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+        with self._lock:
+            for job_id in [k for k, v in self._jobs.items() if v["updated_at"] < cutoff]:
+                del self._jobs[job_id]
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = dict(self._jobs[job_id])
+            job.update(fields)
+            job["updated_at"] = time.time()
+            self._jobs[job_id] = job
+        self._write(job)
+
+    def _run(self, job_id, fn, payload, tracked, lane, cost):
+        control = JobControl(self, job_id)
+        started = time.monotonic()
+        try:
+            control.check()
+            self._update(job_id, status="running")
+            result = fn(payload, control) if tracked else fn(payload)
+        except JobCancelled:
+            self._update(job_id, status="cancelled")
+        except Exception as exc:
+            self._update(job_id, status="failed", error=str(exc))
+        else:
+            self._update(job_id, status="done", result=result)
+        finally:
+            with self._lock:
+                self._cancelled.discard(job_id)
+                lane["jobs"] -= 1
+                lane["bytes"] -= cost
+                lane["avg_seconds"] = 0.8 * lane["avg_seconds"] + 0.2 * (time.monotonic() - started)
+            try:
+                os.remove(self._cancel_path(job_id))
+            except OSError:
+                pass
+
+    def submit(self, kind, fn, payload, tracked=False, lane="default", cost=0):
+        # Tracked jobs are called as fn(payload, control) and can report
+        # progress and stop early on cancel (see JobControl). cost is the
+        # memory the job holds (payload plus work), counted against its lane.
+        lane = self._lanes[lane]
+        if lane["max_bytes"] is not None:
+            # A job larger than the whole budget still runs, just on its own.
+            cost = min(cost, lane["max_bytes"])
+        with self._lock:
+            full = lane["max_jobs"] is not None and lane["jobs"] >= lane["max_jobs"]
+            if lane["max_bytes"] is not None and lane["bytes"] + cost > lane["max_bytes"]:
+                full = True
+            if full:
+                waves = max(1.0, lane["jobs"] / lane["workers"])
+                raise JobQueueFull(max(1, math.ceil(lane["avg_seconds"] * waves)))
+            lane["jobs"] += 1
+            lane["bytes"] += cost
+        self._prune()
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "pid": os.getpid(),
+            "status": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "result": None,
+            "error": None,
+            "progress": None,
+            "cancel_requested": False,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+        self._write(job)
+        lane["executor"].submit(self._run, job["id"], fn, payload, tracked, lane, cost)
+        return job
+
+    def lane_stats(self, name):
+        with self._lock:
+            lane = self._lanes[name]
+            return {
+                "jobs": lane["jobs"],
+                "bytes": lane["bytes"],
+                "workers": lane["workers"],
+                "max_jobs": lane["max_jobs"],
+                "max_bytes": lane["max_bytes"],
+            }
+
+    def cancel(self, job_id):
+        # Queued jobs never start; running tracked jobs stop at their next
+        # check(). Untracked jobs already running finish normally.
+        job = self.get(job_id)
+        if job is None or job["status"] in FINAL_STATUSES:
+            return job
+        with self._lock:
+            local = job_id in self._jobs
+            if local:
+                self._cancelled.add(job_id)
+        if local:
+            self._update(job_id, cancel_requested=True)
+            return self.get(job_id)
+        try:
+            with open(self._cancel_path(job_id), "w", encoding="utf-8"):
+                pass
+        except OSError:
+            return job
+        return dict(job, cancel_requested=True)
+
+    def get(self, job_id):
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return self._read(job_id)
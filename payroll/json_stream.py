@@ -0,0 +1,74 @@
+import json
+
+
+class StreamingListParser:
+    # Incrementally scans a JSON object as it streams in and reports each
+    # string item of the top-level arrays named in `keys` once it is complete.
+    # Text before the first "{" (preambles, code fences) is ignored.
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.text = ""
+        self._pos = 0
+        self._started = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._pending_key = None
+        self._current_key = None
+        self._array_key = None
+
+    def feed(self, chunk):
+        # Returns a list of (key, item) pairs completed by this chunk.
+        self.text += chunk
+        found = []
+        text = self.text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append("{")
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._finish_string(text[self._string_start : self._pos], found)
+                self._pos += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = self._pos + 1
+            elif ch in "{[":
+                if ch == "[" and len(self._stack) == 1:
+                    self._array_key = self._current_key
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if len(self._stack) == 1:
+                    self._array_key = None
+            elif ch == ":" and len(self._stack) == 1:
+                self._current_key = self._pending_key
+            elif ch == "," and len(self._stack) == 1:
+                self._current_key = None
+            self._pos += 1
+        return found
+
+    def _finish_string(self, raw, found):
+        try:
+            value = json.loads(f'"{raw}"')
+        except ValueError:
+            return
+        depth = len(self._stack)
+        if depth == 1:
+            self._pending_key = value
+        elif depth == 2 and self._stack[-1] == "[" and self._array_key in self.keys:
+            found.append((self._array_key, value))
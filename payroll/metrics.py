@@ -0,0 +1,132 @@
+import bisect
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Seconds; spans a small sheet's aggregate up to a large workbook's parse.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    # Counters and histograms kept as plain dicts keyed by a sorted label
+    # tuple, rendered in the Prometheus text format only when /metrics is
+    # scraped. Recording costs one lock and a dict update (plus a bisect for
+    # histograms). Collectors are called at scrape time to report state that
+    # other components already keep (cache, AI client, admission stats), and
+    # yield (name, type, help, [(suffix, labels_dict, value), ...]) where
+    # suffix is "" or a histogram's "_bucket"/"_sum"/"_count".
+    def __init__(self, prefix="payroll"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._listeners = []
+
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=STAGE_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def add_listener(self, listener):
+        # listener(name, labels, value) is called for every histogram
+        # observation, e.g. to build a per-request Server-Timing breakdown.
+        self._listeners.append(listener)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(buckets, value)] += 1
+            entry[1] += value
+        for listener in self._listeners:
+            listener(name, labels, value)
+
+    @contextmanager
+    def time(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        # Decorator form of time().
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(name, **labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: ([*entry[0]], entry[1]) for key, entry in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text, buckets) in self._meta.items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{full}{format_labels(labels)} {format_value(value)}")
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                running = 0
+                for bound, count in zip(buckets + (math.inf,), counts):
+                    running += count
+                    bucket_labels = labels + (("le", format_value(float(bound))),)
+                    lines.append(f"{full}_bucket{format_labels(bucket_labels)} {running}")
+                lines.append(f"{full}_sum{format_labels(labels)} {format_value(round(total, 6))}")
+                lines.append(f"{full}_count{format_labels(labels)} {running}")
+
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {kind}")
+                for suffix, labels, value in samples:
+                    lines.append(f"{full}{suffix}{format_labels(tuple(labels.items()))} {format_value(value)}")
+        return "\n".join(lines) + "\n"
@@ -1,4 +1,5 @@
 import math
+import os
 import re
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
@@ -71,6 +72,7 @@ class PayrollApp(tk.Tk):
 
         self.employee_settings = {}  # emp -> {"percent": 0.1, "penalty": 0.0}
         self.employee_stats = {}  # emp -> {"sales": 0.0, "bonus": 0.0}
+        self._rows_cache = None  # (path, mtime, rows) so a new date range skips re-reading the file
 
         self.summary_sales = tk.StringVar(value="$0.00")
         self.summary_bonus = tk.StringVar(value="$0.00")
@@ -305,7 +307,11 @@ class PayrollApp(tk.Tk):
             raise ValueError("No valid dates found in the sheet.")
         return min_date, max_date
 
-    def _compute_stats(self, path, date_from, date_to):
+    def _load_rows(self, path):
+        mtime = os.path.getmtime(path)
+        if self._rows_cache and self._rows_cache[:2] == (path, mtime):
+            return self._rows_cache[2]
+
         wb = load_workbook(path, data_only=True)
         ws = wb.active
 
@@ -315,8 +321,7 @@ class PayrollApp(tk.Tk):
             if required not in idx:
                 raise ValueError(f"Missing column: {required}")
 
-        stats = {}
-
+        rows = []
         for r in range(2, ws.max_row + 1):
             raw_date = ws.cell(r, idx[DATE_HEADER]).value
             emp = ws.cell(r, idx[EMP_HEADER]).value
@@ -325,10 +330,18 @@ class PayrollApp(tk.Tk):
             row_date = parse_date(raw_date)
             if row_date is None or emp is None:
                 continue
+            rows.append((row_date, emp, parse_money(sales_val)))
+
+        self._rows_cache = (path, mtime, rows)
+        return rows
+
+    def _compute_stats(self, path, date_from, date_to):
+        stats = {}
+
+        for row_date, emp, sales in self._load_rows(path):
             if not (date_from <= row_date <= date_to):
                 continue
 
-            sales = parse_money(sales_val)
             bonus = math.floor(sales / 500.0) * 15.0
 
             if emp not in stats:
@@ -416,6 +429,7 @@ class PayrollApp(tk.Tk):
         self.date_to.set("")
         self.employee_stats = {}
         self.employee_settings = {}
+        self._rows_cache = None
         self.tree.delete(*self.tree.get_children())
         self.summary_sales.set("$0.00")
         self.summary_bonus.set("$0.00")
@@ -0,0 +1,86 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import uuid
+
+
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_request_id(value):
+    # Request ids name files on disk, so only a safe character set is accepted.
+    return bool(value) and REQUEST_ID_RE.match(value) is not None
+
+
+def new_profile_id(request_id):
+    # <request_id>-<random suffix>, still a valid request id. Clients may
+    # reuse an X-Request-ID, and their profiles must not overwrite each other.
+    return f"{request_id[:55]}-{uuid.uuid4().hex[:8]}"
+
+
+class ProfileStore:
+    # Runs opted-in requests under cProfile and keeps the newest `keep`
+    # profiles as <profile_id>.prof (pstats format) in `directory`. Only one
+    # request is profiled at a time: from Python 3.12 cProfile hooks the whole
+    # process, and overlapping runs would blur each other anyway.
+    def __init__(self, directory, keep=50):
+        self.directory = directory
+        self.keep = keep
+        self._busy = threading.Lock()
+
+    def start(self):
+        # Returns a running profiler, or None when another profile is active.
+        if not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiling tool owns the hook
+            self._busy.release()
+            return None
+        return profiler
+
+    def finish(self, profiler, profile_id):
+        try:
+            profiler.disable()
+        finally:
+            self._busy.release()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{profile_id}.prof")
+            tmp_path = f"{path}.tmp"
+            profiler.dump_stats(tmp_path)
+            os.replace(tmp_path, path)
+            self._prune()
+        except OSError:
+            pass
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".prof"):
+                path = os.path.join(self.directory, name)
+                entries.append((os.path.getmtime(path), path))
+        entries.sort(reverse=True)
+        for _, path in entries[self.keep :]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def path(self, profile_id):
+        if not valid_request_id(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.prof")
+        return path if os.path.exists(path) else None
+
+    def summary(self, profile_id, sort="cumulative", limit=40):
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
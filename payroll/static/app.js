@@ -1,6 +1,7 @@
 const fileInput = document.getElementById("fileInput");
 const chatFileInput = document.getElementById("chatFileInput");
 const loadBtn = document.getElementById("loadBtn");
+const cancelBtn = document.getElementById("cancelBtn");
 const clearBtn = document.getElementById("clearBtn");
 const dateFrom = document.getElementById("dateFrom");
 const dateTo = document.getElementById("dateTo");
@@ -11,6 +12,7 @@ const sumSales = document.getElementById("sumSales");
 const sumBonus = document.getElementById("sumBonus");
 const sumTotal = document.getElementById("sumTotal");
 const aiToggle = document.getElementById("aiToggle");
+const aiBudget = document.getElementById("aiBudget");
 const aiTestBtn = document.getElementById("aiTestBtn");
 
 const detailName = document.getElementById("detailName");
@@ -54,6 +56,53 @@ let employees = [];
 let selectedEmployee = null;
 let chart = null;
 let ppvMonth = { ass: [], tits: [], overall: [] };
+let analysisId = null;
+let datasetId = null;
+
+// Employee sections the table and detail view render; shifts and the other
+// per-day maps can be loaded later via /api/analysis/<id>?employees=...&fields=...
+const ANALYSIS_FIELDS = "summary,daily_sales,chat,compare,insights,chat_ai";
+const DAILY_FIELDS = ["daily_sales", "daily_bonus", "daily_hours"];
+
+// Turns an encoding=columnar response back into the default shape: per-day
+// arrays aligned to data.dates become date-keyed maps again and shift column
+// arrays become one object per shift.
+function expandColumnar(data) {
+  if (data.encoding !== "columnar") {
+    return data;
+  }
+  const dates = data.dates || [];
+  const employees = data.employees.map((emp) => {
+    const out = { ...emp };
+    DAILY_FIELDS.forEach((key) => {
+      if (!Array.isArray(emp[key])) {
+        return;
+      }
+      const map = {};
+      emp[key].forEach((value, i) => {
+        if (value !== null) {
+          map[dates[i]] = value;
+        }
+      });
+      out[key] = map;
+    });
+    if (emp.shifts && !Array.isArray(emp.shifts)) {
+      const columns = Object.keys(emp.shifts).filter((key) => key !== "date");
+      out.shifts = emp.shifts.date.map((dateIndex, i) => {
+        const shift = { date: dates[dateIndex] };
+        columns.forEach((key) => {
+          shift[key] = emp.shifts[key][i];
+        });
+        return shift;
+      });
+    }
+    return out;
+  });
+  const expanded = { ...data, employees };
+  delete expanded.encoding;
+  delete expanded.dates;
+  return expanded;
+}
 
 function formatMoney(value) {
   return `$${value.toFixed(2)}`;
@@ -252,6 +301,8 @@ function renderChart(emp) {
 function resetUI() {
   employees = [];
   selectedEmployee = null;
+  analysisId = null;
+  datasetId = null;
   ppvMonth = { ass: [], tits: [], overall: [] };
   tableBody.innerHTML = "";
   detailName.textContent = "Select employee";
@@ -295,6 +346,79 @@ function resetUI() {
   setActiveTab("detailTab");
 }
 
+// Uploads are admission-controlled; a 429 carries Retry-After seconds.
+async function fetchWhenAdmitted(url, options, attempts = 3) {
+  for (let attempt = 1; ; attempt += 1) {
+    const response = await fetch(url, options);
+    if (response.status !== 429 || attempt >= attempts) {
+      return response;
+    }
+    const wait = Number(response.headers.get("Retry-After")) || 1;
+    statusText.textContent = `Server busy, retrying in ${wait}s...`;
+    await new Promise((resolve) => setTimeout(resolve, wait * 1000));
+  }
+}
+
+// Uploads above this size are analyzed as a background job with progress.
+const LARGE_UPLOAD_BYTES = 5 * 1024 * 1024;
+const STAGE_LABELS = {
+  queued: "Queued",
+  waiting_for_capacity: "Waiting for server capacity",
+  parse_sales: "Reading sales",
+  parse_chat: "Reading chats",
+  aggregate: "Calculating",
+  serialize: "Preparing results",
+};
+
+function describeProgress(progress) {
+  if (!progress) {
+    return "Queued...";
+  }
+  const mb = (bytes) => (bytes / (1024 * 1024)).toFixed(1);
+  let text = `${STAGE_LABELS[progress.stage] || progress.stage}: ${progress.rows.toLocaleString()} rows, `;
+  text += `${mb(progress.bytes_read)} of ${mb(progress.total_bytes)} MB`;
+  if (progress.eta_seconds !== null && progress.eta_seconds !== undefined) {
+    text += `, about ${Math.ceil(progress.eta_seconds)}s left`;
+  }
+  return `${text}...`;
+}
+
+// Follows a background analyze job over SSE; resolves with { ok, data } like a
+// finished /api/analyze response.
+function followUploadJob(job) {
+  return new Promise((resolve) => {
+    const source = new EventSource(job.events_url);
+    const finish = (result) => {
+      source.close();
+      cancelBtn.hidden = true;
+      cancelBtn.onclick = null;
+      resolve(result);
+    };
+    cancelBtn.hidden = false;
+    cancelBtn.onclick = () => {
+      statusText.textContent = "Cancelling...";
+      fetch(job.cancel_url, { method: "POST" });
+    };
+    source.addEventListener("progress", (event) => {
+      statusText.textContent = describeProgress(JSON.parse(event.data).progress);
+    });
+    source.addEventListener("done", (event) => {
+      finish({ ok: true, data: JSON.parse(event.data).result });
+    });
+    source.addEventListener("failed", (event) => {
+      finish({ ok: false, data: { error: JSON.parse(event.data).error || "Failed to analyze file." } });
+    });
+    source.addEventListener("cancelled", () => {
+      finish({ ok: false, data: { error: "Analysis cancelled." } });
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        finish({ ok: false, data: { error: "Lost connection to the analysis job." } });
+      }
+    };
+  });
+}
+
 async function analyze() {
   const file = fileInput.files[0];
   if (!file) {
@@ -314,30 +438,72 @@ async function analyze() {
     formData.append("date_to", dateTo.value);
   }
   formData.append("ai_enabled", aiToggle.checked ? "true" : "false");
+  formData.append("fields", ANALYSIS_FIELDS);
+  formData.append("encoding", "columnar");
+  // Waiting for AI scores during the load is a separate opt-in: the AI
+  // toggle alone keeps the load fast and fetches AI output on demand.
+  const budget = aiToggle.checked ? Math.max(0, Number(aiBudget.value) || 0) : 0;
+  if (budget > 0) {
+    formData.append("ai_budget", String(budget));
+  }
+  const uploadBytes = file.size + (chatFileInput.files[0] ? chatFileInput.files[0].size : 0);
+  if (uploadBytes > LARGE_UPLOAD_BYTES) {
+    formData.append("async", "true");
+  }
 
-  statusText.textContent = aiToggle.checked
-    ? "Loading with AI enabled (may take longer)..."
+  statusText.textContent = budget > 0
+    ? `Loading with AI scores (up to ${budget}s longer)...`
     : "Loading...";
 
+  // While the same files stay selected, only the date range changes: re-query
+  // the rows the server already parsed instead of uploading again.
+  const requeryBody = {
+    dataset_id: datasetId,
+    date_from: dateFrom.value || null,
+    date_to: dateTo.value || null,
+    ai_enabled: aiToggle.checked,
+    ai_budget: budget,
+    fields: ANALYSIS_FIELDS,
+    encoding: "columnar",
+  };
+
   let response;
   try {
-    response = await fetch("/api/analyze", {
-      method: "POST",
-      body: formData,
-    });
+    if (datasetId) {
+      response = await fetch("/api/requery", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(requeryBody),
+      });
+    }
+    if (!response || response.status === 404) {
+      datasetId = null;
+      response = await fetchWhenAdmitted("/api/analyze", {
+        method: "POST",
+        body: formData,
+      });
+    }
   } catch (err) {
     statusText.textContent = `Request failed: ${err.message}`;
     return;
   }
 
   let data;
+  let ok = response.ok;
   try {
     data = await response.json();
+    if (response.status === 202) {
+      ({ ok, data } = await followUploadJob(data));
+    }
+    data = expandColumnar(data);
   } catch (err) {
     statusText.textContent = "Failed to parse server response.";
     return;
   }
-  if (!response.ok) {
+  if (data.dataset_id) {
+    datasetId = data.dataset_id;
+  }
+  if (!ok) {
     statusText.textContent = data.error || "Failed to analyze file.";
     return;
   }
@@ -359,6 +525,7 @@ async function analyze() {
     percent: percentValue / 100,
     penalty: 0,
   }));
+  analysisId = data.analysis_id || null;
   ppvMonth = data.ppv_day || { ass: [], tits: [], overall: [] };
   renderPpvList(ppvAssList, ppvMonth.ass);
   renderPpvList(ppvTitsList, ppvMonth.tits);
@@ -380,6 +547,8 @@ async function analyze() {
   renderTable();
   if (data.ai_status === "enabled") {
     statusText.textContent = `Calculated with AI insights (${employees.length} employees).`;
+  } else if (data.ai_status === "circuit_open") {
+    statusText.textContent = `Calculated; AI is temporarily unavailable. Employees: ${employees.length}.`;
   } else if (data.ai_status === "no_key") {
     statusText.textContent = `Calculated without AI (missing key). Employees: ${employees.length}.`;
   } else {
@@ -399,6 +568,11 @@ applyBtn.addEventListener("click", () => {
 });
 
 loadBtn.addEventListener("click", analyze);
+[fileInput, chatFileInput].forEach((input) => {
+  input.addEventListener("change", () => {
+    datasetId = null;
+  });
+});
 clearBtn.addEventListener("click", () => {
   resetUI();
   fileInput.value = "";
@@ -429,19 +603,32 @@ compareBtn.addEventListener("click", async () => {
     return;
   }
 
-  const payload = {
-    user_a: userA,
-    user_b: userB,
-    ai_enabled: aiToggle.checked,
-  };
-
-  let response;
-  try {
-    response = await fetch("/api/compare", {
+  // Refer to the stored analysis by name; re-send the full objects if it expired.
+  const postCompare = (payload) =>
+    fetch("/api/compare", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify(payload),
     });
+
+  let response;
+  try {
+    if (analysisId) {
+      response = await postCompare({
+        analysis_id: analysisId,
+        user_a: userA.employee,
+        user_b: userB.employee,
+        ai_enabled: aiToggle.checked,
+      });
+    }
+    if (!response || response.status === 404) {
+      analysisId = null;
+      response = await postCompare({
+        user_a: userA,
+        user_b: userB,
+        ai_enabled: aiToggle.checked,
+      });
+    }
   } catch (err) {
     statusText.textContent = `Compare failed: ${err.message}`;
     return;
@@ -0,0 +1,31 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+
+PAYROLL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PAYROLL_DIR not in sys.path:
+    sys.path.insert(0, PAYROLL_DIR)
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    # app reads its settings at import time. Grok points at a closed port;
+    # tests aim GROK.url at a stand-in or replace GROK._post.
+    tmp = tmp_path_factory.mktemp("app")
+    os.environ.update(
+        GROK_API_KEY="test",
+        GROK_BASE_URL="http://127.0.0.1:9/v1",
+        AI_CACHE_TTL="0",
+        AI_CACHE_PATH=str(tmp / "ai_cache.sqlite3"),
+        JOBS_DIR=str(tmp / "jobs"),
+        PROFILE_DIR=str(tmp / "profiles"),
+    )
+    return importlib.import_module("app")
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
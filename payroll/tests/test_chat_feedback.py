@@ -0,0 +1,84 @@
+# Chat feedback falls back to local metrics when Grok's answer is unusable:
+# a reply with unreadable scores (never cached), a runner error, or a missed
+# batch deadline, and says which.
+import threading
+
+import pytest
+
+from ai_cache import AICache
+
+
+BAD_REPLY = '{"summary": "x", "risk_score": "high"}'
+EMPLOYEE = {
+    "employee": "Ana",
+    "chat": {
+        "top_sentences": [{"text": "How was your day?"}],
+        "top_baits": [{"text": "New set just dropped"}],
+        "paid_offers": 2,
+        "messages_sent": 40,
+    },
+}
+
+
+@pytest.fixture
+def grok_calls(app_module, monkeypatch):
+    calls = []
+
+    def post(endpoint, messages, max_tokens, timeout, temperature):
+        calls.append(endpoint)
+        return BAD_REPLY
+
+    monkeypatch.setattr(app_module.GROK, "_post", post)
+    monkeypatch.setattr(app_module.GROK, "cache", AICache(ttl=3600))
+    return calls
+
+
+def test_unreadable_scores_fall_back_and_are_not_cached(app_module, client, grok_calls):
+    expected = app_module.build_fallback_chat_feedback(EMPLOYEE, [])
+    before = app_module.GROK.stats().get("chat_feedback", {})
+
+    for _ in range(2):
+        response = client.post("/api/chat-feedback", json={"employee": EMPLOYEE})
+        assert response.status_code == 200
+        assert response.get_json() == expected
+
+    assert grok_calls == ["chat_feedback", "chat_feedback"]
+    after = app_module.GROK.stats()["chat_feedback"]
+    assert after["parse_failures"] == before.get("parse_failures", 0) + 2
+    assert after["fallbacks"]["parse_error"] == before.get("fallbacks", {}).get("parse_error", 0) + 2
+
+
+def test_is_chat_feedback_rejects_unreadable_scores(app_module):
+    assert not app_module.is_chat_feedback(BAD_REPLY)
+    assert not app_module.is_chat_feedback('{"summary": "cut off')
+    assert app_module.is_chat_feedback('{"summary": "ok", "risk_score": 10, "strengths": []}')
+
+
+def test_batch_reports_errors_apart_from_timeouts(app_module, client, monkeypatch):
+    def crash(emp, top_peers, ai_enabled=True):
+        raise ValueError("unreadable reply")
+
+    monkeypatch.setattr(app_module, "build_ai_chat_feedback", crash)
+    response = client.post("/api/chat-feedback/batch", json={"employees": [EMPLOYEE]})
+    body = response.get_json()
+    assert body["timed_out"] == 0 and body["failed"] == 1
+    assert body["results"][0]["timed_out"] is False
+    assert body["results"][0]["fallback_reason"] == "parse_error"
+    assert body["results"][0]["feedback"] == app_module.build_fallback_chat_feedback(EMPLOYEE, [])
+
+
+def test_batch_reports_missed_deadline_as_timeout(app_module, client, monkeypatch):
+    release = threading.Event()
+
+    def slow(emp, top_peers, ai_enabled=True):
+        release.wait(5)
+        return {}
+
+    monkeypatch.setattr(app_module, "build_ai_chat_feedback", slow)
+    try:
+        body = client.post("/api/chat-feedback/batch", json={"employees": [EMPLOYEE], "deadline": 0}).get_json()
+    finally:
+        release.set()
+    assert body["timed_out"] == 1 and body["failed"] == 0
+    assert body["results"][0]["timed_out"] is True
+    assert body["results"][0]["fallback_reason"] == "deadline"
@@ -0,0 +1,68 @@
+# enrich_with_ai records one outcome per call: calls still running at the
+# budget get only the "deadline" fallback, even if they finish later.
+import threading
+
+import pytest
+
+
+EMPLOYEE = {
+    "employee": "Ana",
+    "sales": 100.0,
+    "clocked_hours": 4.0,
+    "scheduled_hours": 4.0,
+    "sales_per_hour": 25.0,
+    "messages_per_hour": 12.0,
+    "response_clock_avg": 3.0,
+}
+
+
+@pytest.fixture
+def slow_insights(app_module, monkeypatch):
+    # Grok answers only once released; finished is set when the call returns.
+    release = threading.Event()
+    finished = threading.Event()
+    original = app_module.request_ai_insights
+
+    def post(endpoint, messages, max_tokens, timeout, temperature):
+        release.wait(5)
+        return '["Sales per hour is steady."]'
+
+    def request_ai_insights(*args, **kwargs):
+        try:
+            return original(*args, **kwargs)
+        finally:
+            finished.set()
+
+    monkeypatch.setattr(app_module.GROK, "_post", post)
+    monkeypatch.setattr(app_module, "request_ai_insights", request_ai_insights)
+    yield release, finished
+    release.set()
+
+
+def outcome_counts(app_module):
+    entry = app_module.GROK.stats().get("insights", {})
+    return entry.get("parsed", 0), entry.get("fallbacks", {}).get("deadline", 0)
+
+
+def test_late_calls_are_not_recorded_twice(app_module, slow_insights):
+    release, finished = slow_insights
+    parsed, deadline = outcome_counts(app_module)
+    employee = dict(EMPLOYEE)
+
+    app_module.enrich_with_ai([employee], 0.05)
+    assert employee["source"]["insights"] == "fallback"
+
+    release.set()
+    assert finished.wait(5)
+    assert outcome_counts(app_module) == (parsed, deadline + 1)
+
+
+def test_calls_within_budget_are_recorded(app_module, slow_insights):
+    release, _ = slow_insights
+    release.set()
+    parsed, deadline = outcome_counts(app_module)
+    employee = dict(EMPLOYEE)
+
+    app_module.enrich_with_ai([employee], 5)
+    assert employee["source"]["insights"] == "ai"
+    assert outcome_counts(app_module) == (parsed + 1, deadline)
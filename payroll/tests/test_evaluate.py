@@ -0,0 +1,41 @@
+# Answers that share no words with the ideal answer may still be correct
+# paraphrases: they must be graded by Grok, not failed locally.
+import pytest
+
+
+PARAPHRASES = [
+    ("Reply as fast as possible so the fan stays engaged.", "Quickly, before they log off."),
+    ("Never share personal contact details with fans.", "Don't give out your phone number or socials."),
+]
+
+
+@pytest.fixture
+def grok_calls(app_module, monkeypatch):
+    calls = []
+
+    def post(endpoint, messages, max_tokens, timeout, temperature):
+        calls.append(endpoint)
+        if endpoint == "evaluate_batch":
+            return '{"results": [{"id": 0, "score": 0.9, "feedback": "Same idea."}, {"id": 1, "score": 0.9, "feedback": "Same idea."}]}'
+        return '{"score": 0.9, "feedback": "Same idea."}'
+
+    monkeypatch.setattr(app_module.GROK, "_post", post)
+    return calls
+
+
+@pytest.mark.parametrize("ideal, answer", PARAPHRASES)
+def test_unmatched_paraphrase_goes_to_grok(client, grok_calls, ideal, answer):
+    response = client.post(
+        "/api/ai/evaluate", json={"question": "What should you do?", "ideal_answer": ideal, "user_answer": answer}
+    )
+    assert response.get_json()["source"] == "grok"
+    assert response.get_json()["correct"] is True
+    assert grok_calls == ["evaluate"]
+
+
+def test_batch_sends_unmatched_paraphrases_to_grok(client, grok_calls):
+    items = [{"question": "What should you do?", "ideal_answer": i, "user_answer": a} for i, a in PARAPHRASES]
+    response = client.post("/api/ai/evaluate/batch", json={"items": items})
+    results = response.get_json()["results"]
+    assert [r["correct"] for r in results] == [True, True]
+    assert grok_calls == ["evaluate_batch"]
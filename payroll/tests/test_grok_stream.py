@@ -0,0 +1,131 @@
+# Streams /api/employee-feedback against tools/grok_standin.py: one stand-in
+# that always answers, one that always breaks off mid-reply.
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+
+STANDIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools", "grok_standin.py")
+EMPLOYEE = {
+    "employee": "Ana",
+    "sales": 1200.0,
+    "hours": 40.0,
+    "sales_per_hour": 30.0,
+    "messages": 900,
+    "ppv_sent": 120,
+    "ppv_unlocked": 30,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_standin(*extra):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, STANDIN, "--port", str(port), "--latency", "fixed:0", *extra],
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            requests.get(f"{base_url}/stats", timeout=1)
+            return proc, base_url
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                proc.kill()
+                raise
+            time.sleep(0.05)
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture(scope="module")
+def standins():
+    healthy = start_standin()
+    failing = start_standin("--stream-error-rate", "1")
+    yield healthy[1], failing[1]
+    for proc, _ in (healthy, failing):
+        proc.kill()
+        proc.wait()
+
+
+@pytest.fixture(autouse=True)
+def healthy_grok(standins, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.GROK, "url", f"{standins[0]}/chat/completions")
+
+
+def test_stream_emits_items_then_result_then_done(client):
+    response = client.post("/api/employee-feedback?stream=1", json={"employee": EMPLOYEE})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    events = parse_sse(response.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[-2:] == ["result", "done"]
+    assert set(names[:-2]) == {"item"}
+
+    result = events[-2][1]
+    items = [(data["key"], data["value"]) for name, data in events if name == "item"]
+    expected = [(key, value) for key in ("strengths", "improvements", "next_steps") for value in result[key]]
+    assert items == expected
+    assert result["next_steps"]
+
+
+def test_stream_reads_usage_only_final_chunk(standins, app_module, client):
+    # The stand-in sends usage in a final chunk with no choices, as the real
+    # API does with stream_options.include_usage.
+    raw = requests.post(
+        f"{standins[0]}/chat/completions",
+        json={"stream": True, "stream_options": {"include_usage": True}, "messages": [{"role": "user", "content": "next_steps"}]},
+        timeout=10,
+    ).text
+    chunks = [line[len("data: ") :] for line in raw.splitlines() if line.startswith("data: ")]
+    assert chunks[-1] == "[DONE]"
+    final = json.loads(chunks[-2])
+    assert final["choices"] == [] and final["usage"]["completion_tokens"] > 0
+
+    before = app_module.GROK.stats().get("employee_feedback", {})
+    client.post("/api/employee-feedback?stream=1", json={"employee": EMPLOYEE}).get_data()
+    after = app_module.GROK.stats()["employee_feedback"]
+    assert after["prompt_tokens"] > before.get("prompt_tokens", 0)
+    assert after["completion_tokens"] > before.get("completion_tokens", 0)
+
+
+def test_stream_reports_mid_stream_error(standins, app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module.GROK, "url", f"{standins[1]}/chat/completions")
+    before = app_module.GROK.stats().get("employee_feedback", {})
+
+    response = client.post("/api/employee-feedback?stream=1", json={"employee": EMPLOYEE})
+    events = parse_sse(response.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[-2:] == ["error", "done"]
+    assert "result" not in names
+    assert "injected stream failure" in events[-2][1]["error"]
+
+    after = app_module.GROK.stats()["employee_feedback"]
+    assert after["errors"] == before.get("errors", 0) + 1
+    assert after["fallbacks"].get("error") == before.get("fallbacks", {}).get("error", 0) + 1
+
+
+@pytest.mark.parametrize("url", ["/api/employee-feedback?stream=1", "/api/chat-feedback?stream=1"])
+def test_stream_rejects_non_object_employee(client, url):
+    response = client.post(url, json={"employee": "Ana"})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid employee"}
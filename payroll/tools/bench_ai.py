@@ -0,0 +1,222 @@
+# Drives the AI endpoints of a running payroll app at a fixed concurrency and
+# reports latency percentiles and fallback rates per endpoint. Pair it with
+# tools/grok_standin.py for repeatable runs:
+#
+#   python tools/bench_ai.py --base-url http://127.0.0.1:5000 --requests 200 --concurrency 16
+#
+# Every request carries a distinct employee name by default so the AI cache and
+# request coalescing do not hide upstream latency; pass --repeat to measure the
+# cached path instead.
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+ENDPOINTS = ("chat-feedback", "compare", "employee-feedback", "evaluate")
+
+COMPARE_FALLBACK_LINES = {
+    "Compare sales, PPV output, and reply time.",
+    "A has stronger sales/hr and better reply time.",
+}
+
+EVAL_CASES = [
+    (
+        "Why follow up after sending free content?",
+        "Following up keeps the fan engaged and makes the next paid offer feel natural.",
+        "A follow up keeps fans engaged so the paid offer that comes next feels natural.",
+    ),
+    (
+        "What should you do when a fan asks for a discount?",
+        "Offer a small bundle deal instead of cutting the price of a single set.",
+        "Give them a bundle with a little discount rather than dropping the single price.",
+    ),
+    (
+        "How fast should you reply to a new fan?",
+        "Reply within a few minutes while the fan is still online.",
+        "Quickly, before they log off.",
+    ),
+]
+
+
+def build_employee(name, seed):
+    rng = random.Random(seed)
+    hours = round(rng.uniform(20, 45), 2)
+    sales = round(rng.uniform(500, 5000), 2)
+    messages_sent = rng.randint(400, 3000)
+    paid_offers = rng.randint(20, 200)
+    purchased = rng.randint(5, paid_offers)
+    return {
+        "employee": name,
+        "sales": sales,
+        "bonus": round(sales * 0.05, 2),
+        "tips": round(sales * 0.1, 2),
+        "ppv_sales": round(sales * 0.6, 2),
+        "dm_sales": round(sales * 0.3, 2),
+        "dm_sent": paid_offers,
+        "fans_chatted": rng.randint(50, 400),
+        "fans_spent": rng.randint(10, 80),
+        "clocked_hours": hours,
+        "scheduled_hours": 40,
+        "sales_per_hour": round(sales / hours, 2),
+        "messages_per_hour": round(messages_sent / hours, 2),
+        "fans_per_hour": round(rng.uniform(2, 10), 2),
+        "response_clock_avg": round(rng.uniform(30, 300), 1),
+        "response_sched_avg": round(rng.uniform(30, 300), 1),
+        "chat": {
+            "messages_sent": messages_sent,
+            "paid_offers": paid_offers,
+            "purchased": purchased,
+            "purchase_revenue": round(sales * 0.5, 2),
+            "reply_time_avg": round(rng.uniform(30, 300), 1),
+            "unique_fans": rng.randint(50, 400),
+            "conversion_rate": round(purchased / paid_offers, 3),
+            "top_sentences": [
+                {"text": "Hey babe, I just finished a shoot and thought of you", "count": 12},
+                {"text": "Want to see what I wore today?", "count": 9},
+            ],
+            "top_baits": [
+                {"text": "I have something special just for you", "revenue": 240.0},
+                {"text": "Unlock this before it's gone", "revenue": 180.0},
+            ],
+        },
+    }
+
+
+def build_request(endpoint, index, repeat):
+    # Returns (path, json body).
+    seed = 0 if repeat else index
+    name = "Bench Chatter" if repeat else f"Bench Chatter {index}"
+    if endpoint == "chat-feedback":
+        peer = build_employee("Top Peer", 10_000)
+        return "/api/chat-feedback", {"employee": build_employee(name, seed), "top_peers": [peer]}
+    if endpoint == "compare":
+        return "/api/compare", {
+            "user_a": build_employee(f"{name} A", seed),
+            "user_b": build_employee(f"{name} B", seed + 1),
+            "ai_enabled": True,
+        }
+    if endpoint == "employee-feedback":
+        return "/api/employee-feedback", {"employee": build_employee(name, seed)}
+    question, ideal, answer = EVAL_CASES[index % len(EVAL_CASES)]
+    if not repeat:
+        answer = f"{answer} ({index})"
+    return "/api/ai/evaluate", {"question": question, "idealAnswer": ideal, "userAnswer": answer}
+
+
+def classify(endpoint, status, body):
+    # Returns "ai", "fallback", "local" or "error".
+    if status >= 400 or not isinstance(body, dict) or "error" in body:
+        return "error"
+    if endpoint == "chat-feedback":
+        return "ai" if "cache" in body else "fallback"
+    if endpoint == "compare":
+        lines = (body.get("summary") or {}).get("why_a_wins") or []
+        return "fallback" if lines and lines[0] in COMPARE_FALLBACK_LINES else "ai"
+    if endpoint == "evaluate":
+        return "local" if body.get("source") == "local" else "ai"
+    return "ai"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def run_one(session, base_url, endpoint, index, repeat, timeout):
+    path, body = build_request(endpoint, index, repeat)
+    started = time.perf_counter()
+    try:
+        response = session.post(base_url + path, json=body, timeout=timeout)
+        status = response.status_code
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+    except requests.RequestException:
+        status, payload = 599, None
+    return time.perf_counter() - started, classify(endpoint, status, payload)
+
+
+def bench_endpoint(base_url, endpoint, total, concurrency, repeat, timeout):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(
+            pool.map(lambda i: run_one(session, base_url, endpoint, i, repeat, timeout), range(total))
+        )
+    wall = time.perf_counter() - started
+
+    latencies = [latency * 1000.0 for latency, _ in results]
+    outcomes = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return {
+        "endpoint": endpoint,
+        "requests": total,
+        "concurrency": concurrency,
+        "throughput_rps": round(total / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies), 1),
+        "outcomes": outcomes,
+        "fallback_rate": round(outcomes.get("fallback", 0) / total, 4),
+        "error_rate": round(outcomes.get("error", 0) / total, 4),
+    }
+
+
+def print_table(reports):
+    header = f"{'endpoint':<18} {'reqs':>5} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'fallback':>9} {'error':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        print(
+            f"{r['endpoint']:<18} {r['requests']:>5} {r['throughput_rps']:>7} "
+            f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+            f"{r['fallback_rate']:>9.1%} {r['error_rate']:>7.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the payroll AI endpoints.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma separated subset of " + ", ".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--repeat", action="store_true", help="send identical payloads to exercise the AI cache")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    base_url = args.base_url.rstrip("/")
+    reports = [
+        bench_endpoint(base_url, endpoint, args.requests, args.concurrency, args.repeat, args.timeout)
+        for endpoint in endpoints
+    ]
+    if args.json:
+        json.dump(reports, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(reports)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# Local OpenAI-compatible stand-in for the Grok API, for load tests and
+# offline development. Point the app at it with:
+#
+#   python tools/grok_standin.py --port 8765 --latency lognormal:1.5:0.5 --error-rate 0.05
+#   GROK_BASE_URL=http://127.0.0.1:8765/v1 GROK_API_KEY=dummy python app.py
+#
+# Latency specs: "fixed:S", "uniform:LO:HI", "normal:MEAN:STD", "lognormal:MEDIAN:SIGMA"
+# (seconds). --canned takes a JSON file mapping prompt substrings to reply
+# content; the first substring found in the prompt wins. --stream-error-rate
+# cuts that fraction of streamed replies off halfway with an in-band error
+# event, the way the upstream API reports failures after the 200 is sent.
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_REPLIES = [
+    ('"results"', None),
+    ('["ok"]', ["ok"]),
+    ("why_a_wins", {
+        "why_a_wins": ["A converts more paid offers.", "A replies faster."],
+        "why_b_lags": ["B sends fewer PPV offers."],
+        "ppv_recommendations": ["B should test A's top PPV bait."],
+        "bait_recommendations": ["B should reuse A's best opener."],
+    }),
+    ("why_money", {
+        "why_money": ["Strong PPV conversion."],
+        "how_money": ["Consistent follow-ups after free content."],
+        "ppv_suggestions": ["Bundle two sets at a small discount."],
+        "bait_suggestions": ["Lead with the top converting bait."],
+    }),
+    ("next_steps", {
+        "strengths": ["Fast replies.", "Good PPV volume."],
+        "improvements": ["Raise conversion on paid offers."],
+        "next_steps": ["Test two new baits this week.", "Follow up within 5 minutes."],
+    }),
+    ("risk_score", {
+        "summary": "Solid chatter with room to convert more offers.",
+        "strengths": ["Warm, personal tone."],
+        "improvements": ["Ask for the sale more directly."],
+        "risk_score": 10,
+        "greedy_score": 30,
+        "fantasy_score": 55,
+        "tos_flags": [],
+    }),
+    ("feedback (short)", {"score": 0.72, "feedback": "Covers the main point."}),
+    ("JSON array of strings", ["Sales per hour is steady.", "Reply time could be faster."]),
+]
+
+
+def parse_latency(spec):
+    parts = spec.split(":")
+    kind = parts[0]
+    args = [float(x) for x in parts[1:]]
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(args[0]), args[1])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+def batch_reply(prompt):
+    ids = [int(x) for x in re.findall(r'\{"id": (\d+)', prompt)]
+    return {"results": [{"id": i, "score": round(random.uniform(0.5, 0.95), 2), "feedback": "Evaluated."} for i in ids]}
+
+
+def pick_reply(prompt, canned):
+    for needle, content in canned:
+        if needle in prompt:
+            return content if isinstance(content, str) else json.dumps(content)
+    for needle, content in DEFAULT_REPLIES:
+        if needle in prompt:
+            return json.dumps(batch_reply(prompt) if content is None else content)
+    return json.dumps({"ok": True})
+
+
+class StandinState:
+    def __init__(self, args):
+        self.latency = parse_latency(args.latency)
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.retry_after = args.retry_after
+        self.chunk_size = args.chunk_size
+        self.stream_error_rate = args.stream_error_rate
+        self.canned = []
+        if args.canned:
+            with open(args.canned, encoding="utf-8") as fh:
+                self.canned = list(json.load(fh).items())
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            raw = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with state.lock:
+                    self._send_json(200, dict(state.counts))
+                return
+            self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": "invalid json"})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": "not found"})
+                return
+
+            state.count("requests")
+            time.sleep(state.latency())
+            roll = random.random()
+            if roll < state.rate_limit_rate:
+                state.count("rate_limited")
+                self._send_json(429, {"error": "rate limited"}, {"Retry-After": str(state.retry_after)})
+                return
+            if roll < state.rate_limit_rate + state.error_rate:
+                state.count("errors")
+                self._send_json(500, {"error": "injected failure"})
+                return
+
+            prompt = "\n".join(str(m.get("content")) for m in body.get("messages") or [])
+            content = pick_reply(prompt, state.canned)
+            usage = {
+                "prompt_tokens": len(prompt) // 4 + 1,
+                "completion_tokens": len(content) // 4 + 1,
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+            if body.get("stream"):
+                include_usage = (body.get("stream_options") or {}).get("include_usage")
+                self._stream(content, body.get("model"), usage if include_usage else None)
+                return
+            self._send_json(
+                200,
+                {
+                    "id": f"standin-{time.time_ns()}",
+                    "object": "chat.completion",
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": usage,
+                },
+            )
+
+        def _stream(self, content, model, usage=None):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.close_connection = True
+            fail_at = None
+            if random.random() < state.stream_error_rate:
+                fail_at = len(content) // 2
+            for i in range(0, len(content), state.chunk_size):
+                if fail_at is not None and i >= fail_at:
+                    state.count("errors")
+                    error = {"error": {"message": "injected stream failure", "type": "server_error"}}
+                    self.wfile.write(f"data: {json.dumps(error)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    return
+                chunk = {
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[i : i + state.chunk_size]}}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(0.01)
+            if usage:
+                chunk = {"object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible Grok stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0.5", help="fixed:S, uniform:LO:HI, normal:MEAN:STD or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="fraction of streams cut off mid-reply with an error event")
+    parser.add_argument("--chunk-size", type=int, default=8, help="characters per streamed delta")
+    parser.add_argument("--canned", help="JSON file mapping prompt substrings to reply content")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    state = StandinState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"Grok stand-in listening on http://{args.host}:{args.port}/v1 (latency {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
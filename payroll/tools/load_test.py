@@ -0,0 +1,186 @@
+# Starts the production entry point (gunicorn -c gunicorn.conf.py wsgi:app)
+# with 1, 2, 4 ... workers in turn and drives one scenario at a fixed
+# concurrency, reporting throughput and latency per worker count:
+#
+#   python tools/load_test.py --workbook sales.xlsx --workers 1,2,4 --concurrency 16
+#
+# Scenarios: "leaderboard" parses the upload on every request (CPU bound),
+# "analyze" uploads a byte-distinct copy of the workbook per request (so the
+# server's content-hash cache never answers it), "requery" exercises the
+# shared dataset/analysis store, and
+# "employee-feedback" is I/O bound on Grok (pair with tools/grok_standin.py
+# via --grok-base-url).
+import argparse
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+from bench_ai import build_employee, percentile
+
+
+PAYROLL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("leaderboard", "analyze", "requery", "employee-feedback")
+
+
+def start_server(port, workers, threads, env_overrides):
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads))
+    env.update(env_overrides, GUNICORN_ACCESS_LOG="")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=PAYROLL_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            if requests.get(base_url + "/", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def with_zip_comment(content, comment):
+    # The same workbook with a different zip archive comment: identical to
+    # openpyxl, but a different content hash.
+    end = content.rfind(b"PK\x05\x06")
+    if end == -1:
+        raise ValueError("workbook is not a zip archive")
+    return content[: end + 20] + len(comment).to_bytes(2, "little") + comment
+
+
+def make_request_fn(scenario, base_url, workbook, timeout):
+    # Returns request(session, i) -> response.
+    with open(workbook, "rb") as fh:
+        content = fh.read()
+    name = os.path.basename(workbook)
+
+    if scenario == "leaderboard":
+        return lambda session, i: session.post(
+            base_url + "/api/leaderboard", files={"file": (name, content)}, timeout=timeout
+        )
+    if scenario == "analyze":
+        run = os.urandom(4).hex()
+        return lambda session, i: session.post(
+            base_url + "/api/analyze",
+            files={"file": (name, with_zip_comment(content, f"load-test {run} {i}".encode()))},
+            data={"fields": "summary"},
+            timeout=timeout,
+        )
+    if scenario == "requery":
+        first = requests.post(
+            base_url + "/api/analyze", files={"file": (name, content)}, data={"fields": "summary"}, timeout=timeout
+        )
+        first.raise_for_status()
+        data = first.json()
+        dataset_id = data["dataset_id"]
+        start = date.fromisoformat(data["min_date"])
+        days = (date.fromisoformat(data["max_date"]) - start).days
+
+        def requery(session, i):
+            rng = random.Random(i)
+            a = rng.randint(0, days)
+            b = rng.randint(a, days)
+            payload = {
+                "dataset_id": dataset_id,
+                "date_from": (start + timedelta(days=a)).isoformat(),
+                "date_to": (start + timedelta(days=b)).isoformat(),
+                "fields": "summary",
+            }
+            return session.post(base_url + "/api/requery", json=payload, timeout=timeout)
+
+        return requery
+    return lambda session, i: session.post(
+        base_url + "/api/employee-feedback",
+        json={"employee": build_employee(f"Load Chatter {i}", i)},
+        timeout=timeout,
+    )
+
+
+def run_load(request_fn, total, concurrency):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            ok = request_fn(session, i).status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    latencies = [latency * 1000.0 for latency, _ in results]
+    return {
+        "rps": round(total / wall, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "errors": sum(1 for _, ok in results if not ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the multi-worker payroll server.")
+    parser.add_argument("--workbook", required=True, help="sales workbook to upload")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="leaderboard")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker counts to compare")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--grok-base-url", help="GROK_BASE_URL for the server, e.g. a local stand-in")
+    args = parser.parse_args()
+
+    workbook = os.path.abspath(args.workbook)
+    overrides = {}
+    if args.grok_base_url:
+        overrides.update(GROK_BASE_URL=args.grok_base_url, GROK_API_KEY=os.getenv("GROK_API_KEY") or "standin")
+
+    print(f"scenario={args.scenario} requests={args.requests} concurrency={args.concurrency} cpus={os.cpu_count()}")
+    print(f"{'workers':>7} {'rps':>8} {'p50':>9} {'p95':>9} {'errors':>7} {'speedup':>8}")
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        process, base_url = start_server(args.port, workers, args.threads, overrides)
+        try:
+            request_fn = make_request_fn(args.scenario, base_url, workbook, args.timeout)
+            request_fn(requests.Session(), -1)  # warm up one worker
+            report = run_load(request_fn, args.requests, args.concurrency)
+        finally:
+            stop_server(process)
+        baseline = baseline or report["rps"]
+        print(
+            f"{workers:>7} {report['rps']:>8} {report['p50_ms']:>9} {report['p95_ms']:>9} "
+            f"{report['errors']:>7} {report['rps'] / baseline:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
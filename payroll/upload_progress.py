@@ -0,0 +1,87 @@
+import io
+import time
+
+
+class CountingStream(io.BytesIO):
+    # An in-memory upload that reports how many bytes each read() returned,
+    # so openpyxl's zip reads drive progress while the workbook loads.
+    def __init__(self, data, on_read):
+        super().__init__(data)
+        self._on_read = on_read
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self._on_read(len(chunk))
+        return chunk
+
+
+class UploadProgress:
+    # Turns parse callbacks into job progress: stage, bytes read from the
+    # uploads, rows scanned and an ETA. Every callback calls check() (which
+    # may raise to cancel); report(**snapshot) runs at most every `interval`
+    # seconds, and on every stage change. total_rows is an estimate from the
+    # sheet dimensions and may be 0 when unknown.
+    def __init__(self, report, check, total_bytes, total_rows, interval=0.5):
+        self._report = report
+        self._check = check
+        self.total_bytes = total_bytes
+        self.total_rows = total_rows
+        self.interval = interval
+        self.stage = "queued"
+        self.bytes_read = 0
+        self.rows = 0
+        self._started = None
+        self._next_report = 0.0
+
+    def stream(self, data):
+        return CountingStream(data, self.add_bytes)
+
+    def set_stage(self, stage):
+        self.stage = stage
+        self._check()
+        self._emit()
+
+    def add_bytes(self, count):
+        if self._started is None:
+            self._started = time.monotonic()
+        self.bytes_read = min(self.total_bytes, self.bytes_read + count)
+        self._tick()
+
+    def add_rows(self, count):
+        self.rows += count
+        self._tick()
+
+    def _tick(self):
+        self._check()
+        if time.monotonic() >= self._next_report:
+            self._emit()
+
+    def fraction(self):
+        # Reading and scanning are weighted equally; without a row estimate
+        # bytes alone drive it. Never reports 1.0 before the job is done.
+        parts = [self.bytes_read / self.total_bytes] if self.total_bytes else []
+        if self.total_rows:
+            parts.append(min(1.0, self.rows / self.total_rows))
+        if not parts:
+            return 0.0
+        return min(0.99, sum(parts) / len(parts))
+
+    def snapshot(self):
+        fraction = self.fraction()
+        eta = None
+        if self._started is not None and fraction >= 0.02:
+            elapsed = time.monotonic() - self._started
+            eta = round(elapsed * (1 - fraction) / fraction, 1)
+        return {
+            "stage": self.stage,
+            "bytes_read": self.bytes_read,
+            "total_bytes": self.total_bytes,
+            "rows": self.rows,
+            "total_rows": self.total_rows,
+            "fraction": round(fraction, 3),
+            "eta_seconds": eta,
+        }
+
+    def _emit(self):
+        self._next_report = time.monotonic() + self.interval
+        self._report(**self.snapshot())
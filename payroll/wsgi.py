@@ -0,0 +1,6 @@
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+# (gunicorn.conf.py sets up the shared store so every worker sees the same
+# analyses, parsed datasets and AI cache.)
+from app import app
+
+__all__ = ["app"]